@@ -50,6 +50,10 @@ class RegisterRequest(BaseModel):
 class ResetPasswordRequest(BaseModel):
     email: EmailStr
 
+class GoogleAuthRequest(BaseModel):
+    id_token: str
+    invite_code: Optional[str] = None
+
 class AuthResponse(BaseModel):
     token: str
     user: UserResponse
@@ -64,6 +68,9 @@ class ProjectCreate(BaseModel):
     theme: str
     custom_theme: Optional[str] = None
 
+class ProjectRename(BaseModel):
+    name: str = Field(min_length=1)
+
 class ProjectUpdate(BaseModel):
     project_id: str
     files: List[ProjectFile]
@@ -143,6 +150,9 @@ class ChatHistory(BaseModel):
     datetime: datetime
     messages: List[ChatMessage]
 
+class InviteCreate(BaseModel):
+    uses: int = Field(1, ge=1, le=100)
+
 class AdminStats(BaseModel):
     totalUsers: int
     totalProjects: int
@@ -5,7 +5,7 @@ from typing import List
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-from api.models.schemas import UserResponse, TokenUsage, AdminStats
+from api.models.schemas import UserResponse, TokenUsage, AdminStats, InviteCreate
 from api.services.firestore import db_service
 from api.routers.auth import get_admin_user
 
@@ -87,12 +87,8 @@ async def get_invites(admin: dict = Depends(get_admin_user)):
     return invites
 
 @router.post("/invites")
-async def create_invite(request: dict, admin: dict = Depends(get_admin_user)):
-    uses = request.get("uses", 1)
-    if uses < 1 or uses > 100:
-        raise HTTPException(status_code=400, detail="Uses must be between 1 and 100")
-
-    invite = await db_service.create_invite(admin["uid"], uses)
+async def create_invite(request: InviteCreate, admin: dict = Depends(get_admin_user)):
+    invite = await db_service.create_invite(admin["uid"], request.uses)
     return invite
 
 @router.delete("/invites/{code}")
@@ -108,7 +108,13 @@ async def agent_edit_stream(request: AgentEditRequest, user: dict = Depends(get_
                     yield f"data: {json_lib.dumps({'type': 'chunk', 'text': event['text']})}\n\n"
                 elif event["type"] == "result":
                     result = event["data"]
-                    yield f"data: {json_lib.dumps({'type': 'result', 'explanation': result.get('explanation', ''), 'changes': result.get('changes', []), 'tokens': 0})}\n\n"
+                    tokens = event.get("tokens", 0)
+                    if tokens:
+                        if request.model == "flash":
+                            await db_service.update_user_tokens(user["uid"], flash_tokens=tokens)
+                        else:
+                            await db_service.update_user_tokens(user["uid"], pro_tokens=tokens)
+                    yield f"data: {json_lib.dumps({'type': 'result', 'explanation': result.get('explanation', ''), 'changes': result.get('changes', []), 'tokens': tokens})}\n\n"
         except Exception as e:
             yield f"data: {json_lib.dumps({'type': 'error', 'message': str(e)})}\n\n"
         yield "data: [DONE]\n\n"
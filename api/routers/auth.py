@@ -1,5 +1,8 @@
 import os
+import asyncio
+import hashlib
 import logging
+import time
 from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -10,7 +13,7 @@ from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from api.models.schemas import (
-    LoginRequest, RegisterRequest, ResetPasswordRequest,
+    LoginRequest, RegisterRequest, ResetPasswordRequest, GoogleAuthRequest,
     AuthResponse, UserResponse, TokenUsage
 )
 from api.services.firestore import db_service
@@ -28,6 +31,28 @@ ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "matt")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "password")
 INVITE_ONLY = os.getenv("INVITE_ONLY", "true").lower() == "true"
 
+# Verified Firebase ID tokens, keyed by token hash. verify_id_token does
+# RSA signature checks (and a JWKS fetch on cold key IDs) on every call;
+# auth runs on every request, so a short TTL turns that into ~one check
+# per token. 5 minutes stays well inside Firebase's 1h token lifetime.
+_TOKEN_CACHE: dict = {}
+_TOKEN_CACHE_TTL = 300.0
+_TOKEN_CACHE_MAX = 10000
+
+
+async def _verify_firebase_token(token: str) -> dict:
+    """Verify a Firebase ID token off the event loop, with a short cache."""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.monotonic()
+    cached = _TOKEN_CACHE.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    decoded = await asyncio.to_thread(auth.verify_id_token, token)
+    if len(_TOKEN_CACHE) >= _TOKEN_CACHE_MAX:
+        _TOKEN_CACHE.clear()
+    _TOKEN_CACHE[key] = (now + _TOKEN_CACHE_TTL, decoded)
+    return decoded
+
 
 def create_jwt_token(uid: str, email: str, role: str) -> str:
     """Create a signed JWT token with expiration."""
@@ -67,7 +92,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
     # Production: try Firebase ID token first, then local JWT
     try:
-        decoded = auth.verify_id_token(token)
+        decoded = await _verify_firebase_token(token)
         user = await db_service.get_user(decoded["uid"])
         if user:
             await db_service.update_last_accessed(decoded["uid"])
@@ -215,17 +240,15 @@ async def register(request: Request, body: RegisterRequest):
             display_name=body.username
         )
 
-        user = await db_service.create_user(
+        # User doc + invite consumption go out in one batched write
+        user = await db_service.register_user(
             uid=user_record.uid,
             email=body.email,
             username=body.username,
-            role=role
+            role=role,
+            invite_code=body.invite_code
         )
 
-        # Use the invite code
-        if body.invite_code:
-            await db_service.use_invite(body.invite_code, user_record.uid)
-
         custom_token = auth.create_custom_token(user_record.uid)
 
         return AuthResponse(
@@ -246,12 +269,9 @@ async def register(request: Request, body: RegisterRequest):
 
 
 @router.post("/google")
-async def google_auth(request: dict):
-    id_token = request.get("id_token")
-    invite_code = request.get("invite_code")
-
-    if not id_token:
-        raise HTTPException(status_code=400, detail="ID token required")
+async def google_auth(request: GoogleAuthRequest):
+    id_token = request.id_token
+    invite_code = request.invite_code
 
     if not db_service.enabled:
         raise HTTPException(status_code=400, detail="Firebase required for Google auth")
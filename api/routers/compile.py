@@ -1,7 +1,9 @@
 import base64
+import hashlib
+import os
 import uuid
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import Response
+from fastapi.responses import FileResponse, Response
 
 from api.models.schemas import CompileRequest, CompileResponse, ProjectFile
 from api.services.firestore import db_service
@@ -14,11 +16,25 @@ router = APIRouter(tags=["Compile"])
 _pdf_cache: dict[str, bytes] = {}
 _MAX_CACHE = 50
 
+# Download cache keyed by content hash: repeat downloads of an unchanged
+# project serve the PDF straight from disk and skip pdflatex entirely
+_download_cache: dict[str, str] = {}
+_MAX_DOWNLOADS_CACHED = 32
+
+def _content_hash(files: list, main_file: str) -> str:
+    h = hashlib.blake2b(main_file.encode(), digest_size=16)
+    for f in files:
+        h.update(f.get("name", "").encode())
+        h.update(f.get("content", "").encode())
+    return h.hexdigest()
+
 @router.post("/compile", response_model=CompileResponse)
 async def compile_latex(request: CompileRequest, user: dict = Depends(get_current_user)):
     files = [f.dict() for f in request.files]
 
-    success, pdf_content, error = await latex_service.compile(files, request.main_file)
+    success, pdf_content, error = await latex_service.compile(
+        files, request.main_file, project_id=request.project_id
+    )
 
     if success and pdf_content:
         # Store PDF in memory and return a URL to fetch it
@@ -57,19 +73,33 @@ async def download_pdf(project_id: str, user: dict = Depends(get_current_user)):
     
     files = project.get("files", [])
     main_file = project.get("main_file", "main.tex")
-    
-    success, pdf_content, error = await latex_service.compile(files, main_file)
-    
+    filename = f"{project.get('name', 'document')}.pdf"
+
+    key = _content_hash(files, main_file)
+    cached = _download_cache.get(key)
+    if cached and os.path.exists(cached):
+        return FileResponse(cached, media_type="application/pdf", filename=filename)
+
+    success, pdf_file, error = await latex_service.compile_to_file(
+        files, main_file, project_id=project_id
+    )
+
     if not success:
         raise HTTPException(status_code=500, detail=error or "Compilation failed")
-    
-    return Response(
-        content=pdf_content,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename={project.get('name', 'document')}.pdf"
-        }
-    )
+
+    # Keep the compiled PDF on disk for repeat downloads; evict the
+    # oldest entry (insertion order) once the cache is full
+    if len(_download_cache) >= _MAX_DOWNLOADS_CACHED:
+        oldest = next(iter(_download_cache))
+        try:
+            os.remove(_download_cache.pop(oldest))
+        except OSError:
+            pass
+    _download_cache[key] = pdf_file
+
+    # FileResponse serves via sendfile(2) - the PDF bytes never pass
+    # through the Python heap
+    return FileResponse(pdf_file, media_type="application/pdf", filename=filename)
 
 @router.post("/regenerate")
 async def regenerate_content(
@@ -1,15 +1,28 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from typing import List, Optional
+import aiofiles
+import asyncio
 import tempfile
 import os
 
 from api.models.schemas import (
-    ProjectCreate, ProjectUpdate, ProjectResponse, ProjectFile, FeedbackRequest
+    ProjectCreate, ProjectRename, ProjectUpdate, ProjectResponse, ProjectFile,
+    FeedbackRequest
 )
 from api.services.firestore import db_service
 from api.services.gemini import gemini_service
 from api.services.latex import latex_service
 from api.routers.auth import get_current_user
+from config import Config
+
+# Stage uploads on tmpfs when available: the DOCX/PDF parsers re-read the
+# file several times and RAM-backed I/O keeps that off the disk
+_UPLOAD_TMPFS = Config.LATEX_TMPFS if os.path.isdir(Config.LATEX_TMPFS) else None
+
+# Back-pressure for /upload: each upload holds a staged file plus a Gemini
+# conversion in flight, so excess requests queue here instead of OOMing
+# the container under a burst
+_UPLOAD_SLOTS = asyncio.Semaphore(Config.MAX_UPLOADS)
 
 router = APIRouter(prefix="/projects", tags=["Projects"])
 
@@ -60,17 +73,17 @@ async def save_project(request: ProjectUpdate, user: dict = Depends(get_current_
     return {"message": "Project saved", "project_id": request.project_id, "updated_at": updated_at}
 
 @router.patch("/{project_id}/rename")
-async def rename_project(project_id: str, request: dict, user: dict = Depends(get_current_user)):
-    name = request.get("name")
-    if not name or not name.strip():
+async def rename_project(project_id: str, request: ProjectRename, user: dict = Depends(get_current_user)):
+    name = request.name.strip()
+    if not name:
         raise HTTPException(status_code=400, detail="Name is required")
-    
-    success = await db_service.update_project_name(project_id, user["uid"], name.strip())
+
+    success = await db_service.update_project_name(project_id, user["uid"], name)
     
     if not success:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    return {"message": "Project renamed", "name": name.strip()}
+    return {"message": "Project renamed", "name": name}
 
 @router.post("/duplicate-project/{project_id}")
 async def duplicate_project(project_id: str, user: dict = Depends(get_current_user)):
@@ -136,70 +149,75 @@ async def upload_file(
         except:
             pass
     
-    # Save file temporarily
-    temp_dir = tempfile.mkdtemp()
-    file_path = os.path.join(temp_dir, file.filename)
-    
-    try:
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        # Extract text from document
+    async with _UPLOAD_SLOTS:
+        # Stage under a server-chosen name: mkstemp hands back an already-open
+        # fd, so the client-supplied filename never touches the filesystem
+        # (no traversal surface) and we skip the second open(2)
+        suffix = os.path.splitext(file.filename)[1].lower()
+        fd, file_path = tempfile.mkstemp(suffix=suffix, dir=_UPLOAD_TMPFS)
         try:
-            if file.filename.endswith('.pdf'):
-                # Extract text from PDF using PyMuPDF
-                import fitz
-                pdf_doc = fitz.open(file_path)
-                text_content = ""
-                for page in pdf_doc:
-                    text_content += page.get_text()
-                pdf_doc.close()
-            else:
-                # Extract text from DOCX
-                from docx import Document
-                doc = Document(file_path)
-                text_content = "\n".join([para.text for para in doc.paragraphs])
-        except:
-            text_content = content.decode("utf-8", errors="ignore")[:5000]
+            # Stream to disk in 1MiB chunks; peak memory stays O(chunk) instead
+            # of O(filesize) when several uploads land at once
+            async with aiofiles.open(fd, "wb") as f:
+                while chunk := await file.read(1024 * 1024):
+                    await f.write(chunk)
+
+
+            # Extract text from document
+            try:
+                if file.filename.endswith('.pdf'):
+                    # Extract text from PDF using PyMuPDF
+                    import fitz
+                    pdf_doc = fitz.open(file_path)
+                    text_content = ""
+                    for page in pdf_doc:
+                        text_content += page.get_text()
+                    pdf_doc.close()
+                else:
+                    # Extract text from DOCX
+                    from docx import Document
+                    doc = Document(file_path)
+                    text_content = "\n".join([para.text for para in doc.paragraphs])
+            except:
+                with open(file_path, "rb") as f:
+                    text_content = f.read(20000).decode("utf-8", errors="ignore")[:5000]
         
-        # Convert to LaTeX using Gemini with custom options
-        latex_content, tokens = await gemini_service.generate_document(
-            text_content, 
-            theme, 
-            custom_theme,
-            custom_prompt=custom_prompt,
-            custom_preamble=custom_preamble,
-            images=image_list
-        )
+            # Convert to LaTeX using Gemini with custom options
+            latex_content, tokens = await gemini_service.generate_document(
+                text_content, 
+                theme, 
+                custom_theme,
+                custom_prompt=custom_prompt,
+                custom_preamble=custom_preamble,
+                images=image_list
+            )
         
-        # Update user tokens
-        await db_service.update_user_tokens(user["uid"], pro_tokens=tokens)
+            # Update user tokens
+            await db_service.update_user_tokens(user["uid"], pro_tokens=tokens)
         
-        # Build project files
-        files = [
-            {"name": "main.tex", "content": latex_content, "type": "tex"},
-            {"name": "references.bib", "content": "", "type": "bib"}
-        ]
+            # Build project files
+            files = [
+                {"name": "main.tex", "content": latex_content, "type": "tex"},
+                {"name": "references.bib", "content": "", "type": "bib"}
+            ]
         
-        # Add custom class file if provided
-        if custom_cls and custom_cls.strip():
-            files.append({"name": "custom.cls", "content": custom_cls, "type": "cls"})
+            # Add custom class file if provided
+            if custom_cls and custom_cls.strip():
+                files.append({"name": "custom.cls", "content": custom_cls, "type": "cls"})
         
-        project = await db_service.create_project(
-            uid=user["uid"],
-            name=file.filename.rsplit(".", 1)[0],
-            theme=theme,
-            files=files,
-            main_file="main.tex",
-            custom_theme=custom_theme
-        )
+            project = await db_service.create_project(
+                uid=user["uid"],
+                name=file.filename.rsplit(".", 1)[0],
+                theme=theme,
+                files=files,
+                main_file="main.tex",
+                custom_theme=custom_theme
+            )
         
-        return {"project_id": project["id"], "tokens_used": tokens}
-    
-    finally:
-        os.remove(file_path)
-        os.rmdir(temp_dir)
+            return {"project_id": project["id"], "tokens_used": tokens}
+
+        finally:
+            os.remove(file_path)
 
 # Feedback endpoint
 feedback_router = APIRouter(tags=["Feedback"])
@@ -1,10 +1,18 @@
 import os
+import asyncio
+import itertools
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, List
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
 from config import Config
 
+# Each google-cloud Firestore client owns one gRPC channel; a small pool
+# rotated per access sidesteps head-of-line blocking on a single channel
+# under concurrent requests
+_CLIENT_POOL_SIZE = 4
+
 def serialize_timestamps(data: Dict) -> Dict:
     """Convert Firestore Timestamps to ISO strings for JSON serialization"""
     result = {}
@@ -27,15 +35,35 @@ class FirestoreService:
         return cls._instance
     
     def __init__(self):
-        self.db = None
+        self._pool = []
+        self._pool_iter = None
         self.enabled = False
         self._dev_data = {"users": {}, "projects": {}, "chats": {}, "invites": {}}
+        # Secondary dev-mode index: uid -> [project_id], so listing a
+        # user's projects is O(theirs) instead of a scan over everyone's
+        self._dev_projects_by_user = {}
+        # Fire-and-forget write queue (chat logs, feedback) drained by a
+        # background task into WriteBatch commits
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Chat history queries repeat on every page load; a short TTL
+        # cache absorbs those re-reads, invalidated on each new chat
+        self._chat_cache: Dict[tuple, tuple] = {}
+        # uids with chat writes still sitting in the queue; while any
+        # are pending, history reads bypass the cache so a read racing
+        # the flush can't pin a stale list for a full TTL
+        self._pending_chat_uids: Dict[str, int] = {}
+
+    @property
+    def db(self):
+        """Next client from the round-robin pool (None in dev mode)."""
+        return next(self._pool_iter) if self._pool_iter else None
 
     def _ensure_initialized(self):
         """Lazy initialization - only runs on first actual use"""
         if FirestoreService._initialized:
             return
-        
+
         try:
             key_path = Config.FIREBASE_KEY_PATH
             print(f"Checking Firebase key at: {key_path}")
@@ -43,9 +71,21 @@ class FirestoreService:
                 if not firebase_admin._apps:
                     cred = credentials.Certificate(key_path)
                     firebase_admin.initialize_app(cred)
-                self.db = firestore.client()
+                pool = [firestore.client()]
+                try:
+                    # Extra clients reuse the admin app's credentials but
+                    # each get their own channel
+                    from google.cloud import firestore as gcf
+                    app = firebase_admin.get_app()
+                    gcp_cred = app.credential.get_credential()
+                    for _ in range(_CLIENT_POOL_SIZE - 1):
+                        pool.append(gcf.Client(project=app.project_id, credentials=gcp_cred))
+                except Exception as pool_err:
+                    print(f"Firestore pool limited to one client: {pool_err}")
+                self._pool = pool
+                self._pool_iter = itertools.cycle(pool)
                 self.enabled = True
-                print("Firebase initialized successfully")
+                print(f"Firebase initialized successfully ({len(pool)} clients)")
             else:
                 print(f"Warning: Firebase key not found at {key_path}")
                 print("Running in development mode")
@@ -53,7 +93,93 @@ class FirestoreService:
             print(f"Firebase init failed: {e}")
         
         FirestoreService._initialized = True
-    
+
+    def _commit_minibatch(self, mutations: List[tuple]):
+        """Apply ("set"|"update", doc_ref, data) mutations in WriteBatch chunks.
+
+        Each commit is one round-trip regardless of mutation count, so
+        coalescing a request's writes here sidesteps the per-write QPS
+        ceiling. Batches split at 400 to stay under Firestore's cap of
+        500; transient commit failures get one retry.
+        """
+        for start in range(0, len(mutations), 400):
+            batch = self.db.batch()
+            for op, doc_ref, data in mutations[start:start + 400]:
+                getattr(batch, op)(doc_ref, data)
+            try:
+                batch.commit()
+            except Exception:
+                from google.api_core import exceptions as gexc
+                try:
+                    batch.commit()
+                except (gexc.Conflict, gexc.DeadlineExceeded) as e:
+                    print(f"Batch commit failed after retry: {e}")
+                    raise
+
+    async def commit_batch(self, mutations: List[tuple]):
+        """Commit ("set"|"update", doc_ref, data) mutations off the event loop."""
+        if mutations:
+            await asyncio.to_thread(self._commit_minibatch, mutations)
+
+    def _enqueue_write(self, collection: str, doc_id: str, data: Dict):
+        """Queue a set() for the background flusher instead of awaiting it.
+
+        For logging-style writes (chat history, feedback) the caller
+        doesn't need durability before responding; queuing lets bursts
+        collapse into one WriteBatch commit instead of an RPC apiece.
+        """
+        if self._write_queue is None:
+            self._write_queue = asyncio.Queue()
+            self._flush_task = asyncio.create_task(self._flush_writes())
+        self._write_queue.put_nowait((collection, doc_id, data))
+
+    async def _flush_writes(self):
+        """Drain the write queue into batched commits, forever."""
+        while True:
+            items = [await self._write_queue.get()]
+            # Linger briefly so writes landing together share one commit
+            try:
+                while len(items) < 400:
+                    items.append(await asyncio.wait_for(self._write_queue.get(), 0.5))
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.commit_batch([
+                    ("set", self.db.collection(coll).document(doc_id), data)
+                    for coll, doc_id, data in items
+                ])
+            except Exception as e:
+                print(f"Background write flush failed ({len(items)} writes): {e}")
+            finally:
+                self._release_pending_chats(items)
+
+    def _release_pending_chats(self, items: List[tuple]):
+        """Drop the pending markers for chat writes that just left the queue."""
+        for coll, _doc_id, data in items:
+            if coll != "chats":
+                continue
+            uid = data.get("uid")
+            count = self._pending_chat_uids.get(uid, 0) - 1
+            if count > 0:
+                self._pending_chat_uids[uid] = count
+            else:
+                self._pending_chat_uids.pop(uid, None)
+
+    async def flush_pending_writes(self):
+        """Drain queued writes now - called from app shutdown."""
+        if not self._write_queue or self._write_queue.empty():
+            return
+        items = []
+        while not self._write_queue.empty():
+            items.append(self._write_queue.get_nowait())
+        try:
+            await self.commit_batch([
+                ("set", self.db.collection(coll).document(doc_id), data)
+                for coll, doc_id, data in items
+            ])
+        finally:
+            self._release_pending_chats(items)
+
     # User operations
     async def create_user(self, uid: str, email: str, username: str, role: str = "user") -> Dict:
         self._ensure_initialized()
@@ -68,16 +194,58 @@ class FirestoreService:
         }
         
         if self.enabled:
-            self.db.collection("users").document(uid).set(user_data)
+            await asyncio.to_thread(
+                self.db.collection("users").document(uid).set, user_data
+            )
         else:
             self._dev_data["users"][uid] = user_data
             
         return user_data
-    
+
+    async def register_user(self, uid: str, email: str, username: str,
+                            role: str = "user", invite_code: Optional[str] = None) -> Dict:
+        """Create a user and consume their invite in one batched commit.
+
+        Registration used to pay two sequential round-trips (user set,
+        invite update); re-checking the invite here keeps that to one
+        read plus one WriteBatch while still tolerating codes that are
+        stale, exhausted or nonexistent. A bad code must never fail the
+        batch: the Firebase Auth account already exists by the time we
+        run, so we fall back to creating the user without consuming it.
+        """
+        self._ensure_initialized()
+        if not self.enabled or not invite_code:
+            user_data = await self.create_user(uid, email, username, role)
+            if invite_code:
+                await self.use_invite(invite_code, uid)
+            return user_data
+
+        if await self.validate_invite(invite_code) is None:
+            return await self.create_user(uid, email, username, role)
+
+        user_data = {
+            "uid": uid,
+            "email": email,
+            "username": username,
+            "role": role,
+            "created_at": datetime.now(timezone.utc),
+            "last_accessed": datetime.now(timezone.utc),
+            "tokens_used": {"total": 0, "flash": 0, "pro": 0}
+        }
+        code = invite_code.strip().upper()
+        await self.commit_batch([
+            ("set", self.db.collection("users").document(uid), user_data),
+            ("update", self.db.collection("invites").document(code), {
+                "used_count": firestore.Increment(1),
+                "used_by": firestore.ArrayUnion([uid])
+            }),
+        ])
+        return user_data
+
     async def get_user(self, uid: str) -> Optional[Dict]:
         self._ensure_initialized()
         if self.enabled:
-            doc = self.db.collection("users").document(uid).get()
+            doc = await asyncio.to_thread(self.db.collection("users").document(uid).get)
             if doc.exists:
                 data = doc.to_dict()
                 data["uid"] = uid
@@ -88,7 +256,8 @@ class FirestoreService:
     async def get_user_by_email(self, email: str) -> Optional[Dict]:
         self._ensure_initialized()
         if self.enabled:
-            users = self.db.collection("users").where("email", "==", email).limit(1).stream()
+            query = self.db.collection("users").where("email", "==", email).limit(1)
+            users = await asyncio.to_thread(lambda: list(query.stream()))
             for user in users:
                 data = user.to_dict()
                 data["uid"] = user.id
@@ -103,7 +272,7 @@ class FirestoreService:
         self._ensure_initialized()
         if self.enabled:
             user_ref = self.db.collection("users").document(uid)
-            user_ref.update({
+            await asyncio.to_thread(user_ref.update, {
                 "tokens_used.flash": firestore.Increment(flash_tokens),
                 "tokens_used.pro": firestore.Increment(pro_tokens),
                 "tokens_used.total": firestore.Increment(flash_tokens + pro_tokens),
@@ -119,7 +288,7 @@ class FirestoreService:
     async def update_last_accessed(self, uid: str):
         self._ensure_initialized()
         if self.enabled:
-            self.db.collection("users").document(uid).update({
+            await asyncio.to_thread(self.db.collection("users").document(uid).update, {
                 "last_accessed": datetime.now(timezone.utc)
             })
         elif uid in self._dev_data["users"]:
@@ -128,7 +297,7 @@ class FirestoreService:
     async def update_user_settings(self, uid: str, settings: Dict) -> bool:
         """Update user settings like custom API key."""
         if self.enabled:
-            self.db.collection("users").document(uid).update({
+            await asyncio.to_thread(self.db.collection("users").document(uid).update, {
                 "settings": settings,
                 "last_accessed": datetime.now(timezone.utc)
             })
@@ -148,8 +317,9 @@ class FirestoreService:
     async def get_all_users(self) -> List[Dict]:
         self._ensure_initialized()
         if self.enabled:
+            docs = await asyncio.to_thread(lambda: list(self.db.collection("users").stream()))
             users = []
-            for doc in self.db.collection("users").stream():
+            for doc in docs:
                 data = doc.to_dict()
                 data["uid"] = doc.id
                 users.append(data)
@@ -159,7 +329,7 @@ class FirestoreService:
     async def delete_user(self, uid: str):
         self._ensure_initialized()
         if self.enabled:
-            self.db.collection("users").document(uid).delete()
+            await asyncio.to_thread(self.db.collection("users").document(uid).delete)
             try:
                 auth.delete_user(uid)
             except:
@@ -170,7 +340,7 @@ class FirestoreService:
     async def reset_user_tokens(self, uid: str):
         self._ensure_initialized()
         if self.enabled:
-            self.db.collection("users").document(uid).update({
+            await asyncio.to_thread(self.db.collection("users").document(uid).update, {
                 "tokens_used": {"total": 0, "flash": 0, "pro": 0}
             })
         elif uid in self._dev_data["users"]:
@@ -194,16 +364,19 @@ class FirestoreService:
         }
         
         if self.enabled:
-            self.db.collection("projects").document(project_id).set(project_data)
+            await asyncio.to_thread(
+                self.db.collection("projects").document(project_id).set, project_data
+            )
         else:
             self._dev_data["projects"][project_id] = project_data
-            
+            self._dev_projects_by_user.setdefault(uid, []).append(project_id)
+
         return {"id": project_id, **serialize_timestamps(project_data)}
     
     async def get_project(self, project_id: str, uid: str) -> Optional[Dict]:
         self._ensure_initialized()
         if self.enabled:
-            doc = self.db.collection("projects").document(project_id).get()
+            doc = await asyncio.to_thread(self.db.collection("projects").document(project_id).get)
             if doc.exists:
                 data = serialize_timestamps(doc.to_dict())
                 if data.get("user_id") == uid:
@@ -217,22 +390,34 @@ class FirestoreService:
     async def get_user_projects(self, uid: str) -> List[Dict]:
         self._ensure_initialized()
         if self.enabled:
-            projects = []
-            for doc in self.db.collection("projects").where("user_id", "==", uid).stream():
-                data = serialize_timestamps(doc.to_dict())
-                projects.append({"id": doc.id, **data})
-            return projects
-        return [{"id": pid, **serialize_timestamps(p)} for pid, p in self._dev_data["projects"].items() 
-                if p.get("user_id") == uid]
+            query = self.db.collection("projects").where("user_id", "==", uid)
+            docs = await asyncio.to_thread(lambda: list(query.stream()))
+            return [{"id": doc.id, **serialize_timestamps(doc.to_dict())} for doc in docs]
+        projects = self._dev_data["projects"]
+        return [{"id": pid, **serialize_timestamps(projects[pid])}
+                for pid in self._dev_projects_by_user.get(uid, []) if pid in projects]
     
+    async def _owns_project(self, project_id: str, uid: str) -> bool:
+        """Ownership check that reads only user_id, not the file payload.
+
+        Project docs carry full file contents, so fetching the whole doc
+        just to gate a write moves megabytes for one string compare; a
+        field mask keeps the read to a few bytes.
+        """
+        if not self.enabled:
+            project = self._dev_data["projects"].get(project_id)
+            return bool(project and project.get("user_id") == uid)
+        doc_ref = self.db.collection("projects").document(project_id)
+        doc = await asyncio.to_thread(lambda: doc_ref.get(field_paths=["user_id"]))
+        return doc.exists and doc.get("user_id") == uid
+
     async def update_project(self, project_id: str, uid: str, files: List[Dict]) -> bool:
         self._ensure_initialized()
-        project = await self.get_project(project_id, uid)
-        if not project:
+        if not await self._owns_project(project_id, uid):
             return False
             
         if self.enabled:
-            self.db.collection("projects").document(project_id).update({
+            await asyncio.to_thread(self.db.collection("projects").document(project_id).update, {
                 "files": files,
                 "updated_at": datetime.now(timezone.utc)
             })
@@ -243,12 +428,11 @@ class FirestoreService:
     
     async def update_project_name(self, project_id: str, uid: str, name: str) -> bool:
         self._ensure_initialized()
-        project = await self.get_project(project_id, uid)
-        if not project:
+        if not await self._owns_project(project_id, uid):
             return False
             
         if self.enabled:
-            self.db.collection("projects").document(project_id).update({
+            await asyncio.to_thread(self.db.collection("projects").document(project_id).update, {
                 "name": name,
                 "updated_at": datetime.now(timezone.utc)
             })
@@ -259,14 +443,16 @@ class FirestoreService:
     
     async def delete_project(self, project_id: str, uid: str) -> bool:
         self._ensure_initialized()
-        project = await self.get_project(project_id, uid)
-        if not project:
+        if not await self._owns_project(project_id, uid):
             return False
             
         if self.enabled:
-            self.db.collection("projects").document(project_id).delete()
+            await asyncio.to_thread(self.db.collection("projects").document(project_id).delete)
         else:
             self._dev_data["projects"].pop(project_id, None)
+            ids = self._dev_projects_by_user.get(uid)
+            if ids and project_id in ids:
+                ids.remove(project_id)
         return True
     
     async def duplicate_project(self, project_id: str, uid: str) -> Optional[Dict]:
@@ -297,7 +483,10 @@ class FirestoreService:
         }
         
         if self.enabled:
-            self.db.collection("chats").document(chat_id).set(chat_data)
+            self._pending_chat_uids[uid] = self._pending_chat_uids.get(uid, 0) + 1
+            self._enqueue_write("chats", chat_id, chat_data)
+            self._chat_cache.pop((uid, project_id), None)
+            self._chat_cache.pop((uid, None), None)
         else:
             self._dev_data["chats"][chat_id] = chat_data
             
@@ -306,14 +495,25 @@ class FirestoreService:
     async def get_chat_history(self, uid: str, project_id: str) -> List[Dict]:
         self._ensure_initialized()
         if self.enabled:
-            chats = []
+            # While this uid has chat writes queued but not yet committed,
+            # neither serve nor populate the cache: a read landing in the
+            # flush window would otherwise cache a list missing the new
+            # message and serve it for the whole TTL
+            cache_key = (uid, project_id)
+            pending = uid in self._pending_chat_uids
+            if not pending:
+                cached = self._chat_cache.get(cache_key)
+                if cached and time.monotonic() - cached[0] < 10.0:
+                    return cached[1]
+
             query = self.db.collection("chats").where("uid", "==", uid)
             if project_id:
                 query = query.where("project_id", "==", project_id)
-            for doc in query.order_by("datetime", direction=firestore.Query.DESCENDING).limit(50).stream():
-                data = doc.to_dict()
-                data["id"] = doc.id
-                chats.append(data)
+            query = query.order_by("datetime", direction=firestore.Query.DESCENDING).limit(50)
+            docs = await asyncio.to_thread(lambda: list(query.stream()))
+            chats = [{**doc.to_dict(), "id": doc.id} for doc in docs]
+            if not pending:
+                self._chat_cache[cache_key] = (time.monotonic(), chats)
             return chats
         return [{"id": cid, **c} for cid, c in self._dev_data["chats"].items() 
                 if c.get("uid") == uid and (not project_id or c.get("project_id") == project_id)]
@@ -322,8 +522,10 @@ class FirestoreService:
     async def get_stats(self) -> Dict:
         self._ensure_initialized()
         if self.enabled:
-            users = list(self.db.collection("users").stream())
-            projects = list(self.db.collection("projects").stream())
+            users, projects = await asyncio.gather(
+                asyncio.to_thread(lambda: list(self.db.collection("users").stream())),
+                asyncio.to_thread(lambda: list(self.db.collection("projects").stream())),
+            )
             
             total_tokens = 0
             active_today = 0
@@ -364,7 +566,7 @@ class FirestoreService:
         }
         
         if self.enabled:
-            self.db.collection("feedback").document(feedback_id).set(feedback_data)
+            self._enqueue_write("feedback", feedback_id, feedback_data)
         
         return feedback_id
     
@@ -385,7 +587,9 @@ class FirestoreService:
         }
         
         if self.enabled:
-            self.db.collection("invites").document(code).set(invite_data)
+            await asyncio.to_thread(
+                self.db.collection("invites").document(code).set, invite_data
+            )
         else:
             self._dev_data["invites"][code] = invite_data
         
@@ -395,7 +599,7 @@ class FirestoreService:
         self._ensure_initialized()
         code = code.strip().upper()
         if self.enabled:
-            doc = self.db.collection("invites").document(code).get()
+            doc = await asyncio.to_thread(self.db.collection("invites").document(code).get)
             if doc.exists:
                 data = doc.to_dict()
                 if data.get("active") and data.get("used_count", 0) < data.get("max_uses", 1):
@@ -412,11 +616,11 @@ class FirestoreService:
         code = code.strip().upper()
         if self.enabled:
             doc_ref = self.db.collection("invites").document(code)
-            doc = doc_ref.get()
+            doc = await asyncio.to_thread(doc_ref.get)
             if doc.exists:
                 data = doc.to_dict()
                 if data.get("active") and data.get("used_count", 0) < data.get("max_uses", 1):
-                    doc_ref.update({
+                    await asyncio.to_thread(doc_ref.update, {
                         "used_count": firestore.Increment(1),
                         "used_by": firestore.ArrayUnion([used_by_uid])
                     })
@@ -433,8 +637,10 @@ class FirestoreService:
     async def get_all_invites(self) -> List[Dict]:
         self._ensure_initialized()
         if self.enabled:
+            query = self.db.collection("invites").order_by("created_at", direction=firestore.Query.DESCENDING)
+            docs = await asyncio.to_thread(lambda: list(query.stream()))
             invites = []
-            for doc in self.db.collection("invites").order_by("created_at", direction=firestore.Query.DESCENDING).stream():
+            for doc in docs:
                 data = doc.to_dict()
                 data["code"] = doc.id
                 invites.append(data)
@@ -446,8 +652,9 @@ class FirestoreService:
         code = code.strip().upper()
         if self.enabled:
             doc_ref = self.db.collection("invites").document(code)
-            if doc_ref.get().exists:
-                doc_ref.update({"active": False})
+            doc = await asyncio.to_thread(doc_ref.get)
+            if doc.exists:
+                await asyncio.to_thread(doc_ref.update, {"active": False})
                 return True
             return False
         
@@ -2,16 +2,35 @@ import os
 import re
 import json
 import asyncio
+import bisect
 import hashlib
+import heapq
+import itertools
+import random
+import time
 import httpx
-from datetime import datetime, timedelta
-from typing import Tuple, List, Optional, Dict, Any
+import orjson
+from types import MappingProxyType
+from typing import AsyncIterator, Tuple, List, Optional, Dict, Any
 from config import Config
 
 # Gemini models
 FLASH_MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3.0-flash-preview")
 PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", "gemini-3.1-pro-preview")
 
+# Gemini's cachedContents floor is ~1024 tokens; chars are a cheap local
+# proxy for that. Borderline contents the server still refuses land in
+# the negative cache, so guessing low costs at most one failed attempt.
+_CACHE_MIN_CHARS = 1100
+
+# finishReason values meaning the model was stopped with nothing usable,
+# mapped to the user-facing explanation
+_BLOCKED_REASONS = {
+    "RECITATION": "Detected potential copyrighted content",
+    "SAFETY": "Content filtered by safety settings",
+    "OTHER": "Content blocked by filter",
+}
+
 class TokenLimitError(Exception):
     """Raised when response is truncated due to max_tokens limit."""
     def __init__(self, message: str, partial_text: str = "", tokens: int = 0):
@@ -25,8 +44,9 @@ class ContentBlockedError(Exception):
         super().__init__(message)
         self.reason = reason
 
-# Structured output schemas - Operation-based for token efficiency
-AGENT_EDIT_SCHEMA = {
+# Structured output schemas - Operation-based for token efficiency.
+# Frozen so nothing mutates it after the pre-serialized bytes below are built.
+AGENT_EDIT_SCHEMA = MappingProxyType({
     "type": "object",
     "properties": {
         "explanation": {"type": "string"},
@@ -53,13 +73,171 @@ AGENT_EDIT_SCHEMA = {
         }
     },
     "required": ["explanation", "operations"]
+})
+
+# Serialized once at import so every agent-edit request splices the same bytes
+# instead of re-walking the nested schema dict.
+_AGENT_EDIT_SCHEMA_BYTES = orjson.dumps(dict(AGENT_EDIT_SCHEMA))
+
+# Autocomplete fires on every typing pause, so its static payload pieces are
+# built once here instead of per keystroke.
+_AUTOCOMPLETE_GEN_CONFIG_BYTES = orjson.dumps({"temperature": 0.1, "maxOutputTokens": 100})
+
+# Stable instruction preamble - identical on every keystroke, so it is a
+# candidate for Gemini cachedContents (created lazily on first use).
+_AUTOCOMPLETE_SYSTEM_PREAMBLE = """You are a LaTeX expert providing intelligent autocomplete.
+Given the code before the user's cursor and the current file name, provide a
+SINGLE short completion (1-2 lines max) that would logically follow.
+Return ONLY the completion text, nothing else. No explanations."""
+
+_AUTOCOMPLETE_PROMPT_TEMPLATE = _AUTOCOMPLETE_SYSTEM_PREAMBLE + """
+
+Context (code before cursor):
+{context}
+
+File: {file_name}"""
+
+_AUTOCOMPLETE_CONTEXT_TEMPLATE = """Context (code before cursor):
+{context}
+
+File: {file_name}"""
+
+# Chunk-boundary patterns for _chunk_document, compiled once. Regex
+# compilation holds the GIL, so recompiling per call hurts under load.
+_SECTION_REGEX = re.compile(
+    r'\\section\{'
+    r'|\\subsection\{'
+    r'|\\chapter\{'
+    r'|\\begin\{document\}'
+    r'|\\end\{document\}'
+    r'|^\\begin\{(?:figure|table|equation|align|itemize|enumerate)\}'
+    r'|^$'
+)
+
+# Anchor extraction for the batched pre-filter: explicit \commands in the
+# instruction plus structural keywords that reliably map to document text.
+_ANCHOR_KEYWORD_RE = re.compile(
+    r'\\[a-zA-Z]+|section|chapter|figure|table|equation|bold|italic'
+)
+# Keywords whose match target in the source differs from the word itself
+_ANCHOR_SYNONYMS = {
+    'bold': ('textbf',),
+    'italic': ('textit', 'emph'),
+    'equation': ('equation', 'align', '$'),
 }
 
+# The agent-edit prompt is split so the stable part (preamble + document) can
+# be hoisted into a Gemini cachedContents prefix; only the instruction suffix
+# is re-sent per call.
+# Anchors for salvaging truncated agent-edit responses
+_OPS_START_RE = re.compile(r'"operations"\s*:\s*\[')
+_EXPL_RE = re.compile(r'"explanation"\s*:\s*"([^"]*)"')
+
+_AGENT_EDIT_DOC_TEMPLATE = """You are an AI agent that edits LaTeX documents.
+
+Document:
+{document}
+{truncated_note}"""
+
+_AGENT_EDIT_INSTRUCTION_TEMPLATE = """{selection_context}
+User instruction: {instruction}
+
+Analyze the document and provide specific changes. Return a JSON object with:
+{{
+  "explanation": "Brief explanation of what you will do",
+  "changes": [
+    {{
+      "start_line": <line number>,
+      "end_line": <line number>,
+      "original": "exact original text",
+      "replacement": "new text",
+      "reason": "why this change"
+    }}
+  ]
+}}
+
+Return ONLY valid JSON, no markdown formatting. Keep your response concise."""
+
+_CHAT_CONTEXT_TEMPLATE = """You are a LaTeX expert assistant.
+
+Document context:
+{context}"""
+
+# Char budget for the document slice sent with each chat turn; prompt
+# size scales latency and cost linearly, so big documents get windowed
+_CHAT_CONTEXT_BUDGET = 6000
+# Fragments worth anchoring on: backtick-quoted snippets or LaTeX
+# commands the user pasted into their message
+_CHAT_ANCHOR_RE = re.compile(r"`([^`\n]{4,})`|(\\[A-Za-z]+\{[^}\n]*\})")
+
+def _chat_context_window(context: str, message: str, budget: int) -> str:
+    """Pick the most relevant document slice for a chat turn.
+
+    A head slice of a long document is usually just the preamble. If the
+    message quotes a snippet that occurs verbatim in the document, centre
+    the window there instead; otherwise fall back to the head.
+    """
+    if len(context) <= budget:
+        return context
+    for m in _CHAT_ANCHOR_RE.finditer(message):
+        frag = m.group(1) or m.group(2)
+        idx = context.find(frag)
+        if idx != -1:
+            start = max(0, idx - budget // 2)
+            return context[start:start + budget]
+    return context[:budget]
+
+_CHAT_MESSAGE_TEMPLATE = """User message: {message}
+
+Provide helpful, concise assistance. If suggesting code changes, show the LaTeX code clearly."""
+
+# Dev-mode canned responses, built once at import
+_DEV_LATEX_RESPONSE = r"""\documentclass{article}
+\usepackage{amsmath}
+\usepackage{graphicx}
+\usepackage{geometry}
+
+\geometry{a4paper, margin=1in}
+
+\title{Sample Document}
+\author{UEA AI}
+\date{\today}
+
+\begin{document}
+\maketitle
+
+\section{Introduction}
+This is a sample LaTeX document generated for development purposes.
+
+\section{Content}
+Lorem ipsum dolor sit amet, consectetur adipiscing elit.
+
+\section{Conclusion}
+This document demonstrates the basic LaTeX structure.
+
+\end{document}"""
+
+_DEV_EDIT_RESPONSE = orjson.dumps({
+    "explanation": "Dev mode: Sample edit suggestion",
+    "changes": [{
+        "start_line": 1,
+        "end_line": 2,
+        "original": "Original text",
+        "replacement": "Improved text",
+        "reason": "Dev mode suggestion"
+    }]
+}).decode()
+
 class PromptCache:
     """Redis-backed cache for Gemini prompt context names, with in-memory fallback."""
     def __init__(self, ttl_minutes: int = 30):
-        self.ttl_seconds = ttl_minutes * 60
+        self.ttl_seconds = ttl_minutes * 60.0
         self._local: Dict[str, Dict] = {}
+        # Keys Gemini refused to cache recently - avoids re-attempting the
+        # remote create (a slow POST) for the same content over and over.
+        self._negative: Dict[str, float] = {}
+        self._max_negative = 512
+        self._op_count = 0
         self._redis = None
 
         redis_url = os.getenv("REDIS_URL")
@@ -74,8 +252,15 @@ class PromptCache:
                 print(f"Prompt cache: Redis init failed ({e}), using in-memory fallback")
 
     def _hash_key(self, content: str, model: str) -> str:
-        h = hashlib.md5(f"{model}:{content[:1000]}".encode()).hexdigest()
-        return f"prompt_cache:{h}"
+        # Hash the FULL content: LaTeX documents routinely share identical
+        # preambles, so hashing only a prefix produced false cache hits.
+        # blake2b is fast enough that the whole document costs less than
+        # MD5 on 1KB did.
+        h = hashlib.blake2b(digest_size=16, usedforsecurity=False)
+        h.update(model.encode())
+        h.update(b"\0")
+        h.update(content.encode())
+        return f"prompt_cache:{h.digest().hex()}"
 
     async def get(self, content: str, model: str) -> Optional[str]:
         key = self._hash_key(content, model)
@@ -87,7 +272,8 @@ class PromptCache:
         # Fallback to local dict
         entry = self._local.get(key)
         if entry:
-            if datetime.now() < entry["expires"]:
+            # Expiry only needs monotonic deltas, not wall-clock datetimes
+            if time.monotonic() < entry["expires"]:
                 return entry["cache_name"]
             del self._local[key]
         return None
@@ -103,15 +289,36 @@ class PromptCache:
         # Fallback to local dict
         self._local[key] = {
             "cache_name": cache_name,
-            "expires": datetime.now() + timedelta(seconds=self.ttl_seconds)
+            "expires": time.monotonic() + self.ttl_seconds
         }
+        # Nothing calls cleanup() on a schedule, so sweep the fallback dict
+        # every 256 writes to keep it from growing unboundedly
+        self._op_count += 1
+        if self._op_count & 0xFF == 0:
+            self.cleanup()
+
+    def is_negative(self, content: str, model: str) -> bool:
+        """True if a cache-create for this content failed within the TTL."""
+        expires = self._negative.get(self._hash_key(content, model))
+        if expires is None:
+            return False
+        if time.monotonic() < expires:
+            return True
+        del self._negative[self._hash_key(content, model)]
+        return False
+
+    def set_negative(self, content: str, model: str):
+        """Remember that Gemini refused to cache this content."""
+        if len(self._negative) >= self._max_negative:
+            # Drop the oldest entry (insertion order ~ creation order)
+            self._negative.pop(next(iter(self._negative)))
+        self._negative[self._hash_key(content, model)] = time.monotonic() + self.ttl_seconds
 
     def cleanup(self):
         """Clean expired entries from local fallback cache (Redis handles TTL natively)."""
-        now = datetime.now()
-        expired = [k for k, v in self._local.items() if now >= v["expires"]]
-        for k in expired:
-            del self._local[k]
+        now = time.monotonic()
+        self._local = {k: v for k, v in self._local.items() if now < v["expires"]}
+        self._negative = {k: exp for k, exp in self._negative.items() if now < exp}
 
 class GeminiService:
     def __init__(self):
@@ -119,12 +326,33 @@ class GeminiService:
         self.gemini_base_url = "https://generativelanguage.googleapis.com/v1beta"
         self.enabled = bool(self.gemini_api_key)
         self.prompt_cache = PromptCache(ttl_minutes=30)
+        # Long-lived client so hot paths skip per-call TCP+TLS setup.
+        # HTTP/2 lets concurrent chat/autocomplete calls share one connection.
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=30,
+                keepalive_expiry=75.0,
+            ),
+        )
+        # Global in-flight cap so a traffic spike queues here instead of
+        # tripping the upstream QPS quota and paying retry storms
+        self._api_slots = asyncio.Semaphore(Config.GEMINI_CONCURRENCY)
+        # In-flight background cachedContents creations, keyed by content
+        # hash so concurrent turns don't create duplicate caches
+        self._cache_create_tasks: Dict[str, asyncio.Task] = {}
 
         if self.gemini_api_key:
             print("Gemini AI enabled")
         else:
             print("Warning: GEMINI_API_KEY not set. AI features disabled.")
     
+    async def aclose(self):
+        """Close the shared HTTP client (wired to FastAPI shutdown)."""
+        await self._client.aclose()
+
     def get_api_key(self, custom_key: Optional[str] = None) -> Optional[str]:
         if custom_key and custom_key.strip():
             return custom_key.strip()
@@ -135,11 +363,18 @@ class GeminiService:
         content: str,
         model: str,
         api_key: str,
-        display_name: str = "document_cache"
+        display_name: str = "document_cache",
+        enforce_min: bool = True
     ) -> Optional[str]:
-        """Create a cached content object in Gemini API."""
-        # Only cache if content is substantial (>2000 chars)
-        if len(content) < 2000:
+        """Create a cached content object in Gemini API.
+
+        enforce_min=False lets callers with fixed, known content (the
+        autocomplete preamble) attempt creation regardless of size and
+        let the server be the judge; a refusal lands in the negative
+        cache so it's only ever tried once.
+        """
+        # Below the size floor the API refuses anyway; skip the round-trip
+        if enforce_min and len(content) < _CACHE_MIN_CHARS:
             return None
 
         # Check cache first
@@ -147,6 +382,10 @@ class GeminiService:
         if cached:
             return cached
 
+        # Skip contents Gemini recently refused to cache
+        if self.prompt_cache.is_negative(content, model):
+            return None
+
         url = f"{self.gemini_base_url}/cachedContents?key={api_key}"
         payload = {
             "model": f"models/{model}",
@@ -154,19 +393,42 @@ class GeminiService:
             "displayName": display_name
         }
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30.0)
-                if response.status_code == 200:
-                    result = response.json()
-                    cache_name = result.get("name")
-                    if cache_name:
-                        await self.prompt_cache.set(content, model, cache_name)
-                        return cache_name
+            response = await self._client.post(
+                url,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
+                timeout=30.0,
+            )
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                cache_name = result.get("name")
+                if cache_name:
+                    await self.prompt_cache.set(content, model, cache_name)
+                    return cache_name
         except Exception as e:
             print(f"Cache creation failed: {e}")
-        
+
+        self.prompt_cache.set_negative(content, model)
         return None
     
+    def _spawn_cache_create(self, content: str, model: str, api_key: str,
+                            display_name: str, enforce_min: bool = True):
+        """Kick off cachedContents creation without blocking the caller.
+
+        The current request proceeds uncached; the next request for the same
+        content finds the cache name via PromptCache. Deduplicates in-flight
+        creations by content hash.
+        """
+        key = self.prompt_cache._hash_key(content, model)
+        if key in self._cache_create_tasks:
+            return
+        task = asyncio.create_task(
+            self._create_cached_content(content, model, api_key, display_name,
+                                        enforce_min=enforce_min)
+        )
+        self._cache_create_tasks[key] = task
+        task.add_done_callback(lambda _t: self._cache_create_tasks.pop(key, None))
+
     def _build_image_parts(self, images: Optional[List[str]]) -> List[Dict]:
         """Convert base64 images to API format."""
         parts = []
@@ -174,8 +436,10 @@ class GeminiService:
             return parts
         for img_data in images:
             if img_data.startswith('data:'):
-                header, data = img_data.split(',', 1)
-                mime_type = header.split(':')[1].split(';')[0]
+                # partition avoids the list allocation of split(',', 1) -
+                # data can be multiple MB of base64, so copies matter here
+                header, _, data = img_data.partition(',')
+                mime_type = header[5:].partition(';')[0]
             else:
                 data = img_data
                 mime_type = 'image/jpeg'
@@ -188,15 +452,11 @@ class GeminiService:
         prompt: str,
         temperature: float = 0.2,
         max_tokens: int = 2048,
-        api_key: Optional[str] = None,
+        key: str = "",
         images: Optional[List[str]] = None,
         response_schema: Optional[Dict] = None,
         cached_content: Optional[str] = None
     ) -> Tuple[str, int]:
-        key = self.get_api_key(api_key)
-        if not key:
-            return self._dev_response(prompt), 0
-
         url = f"{self.gemini_base_url}/models/{model}:generateContent?key={key}"
 
         # Build parts
@@ -212,7 +472,11 @@ class GeminiService:
         # Add structured output if schema provided
         if response_schema:
             gen_config["responseMimeType"] = "application/json"
-            gen_config["responseSchema"] = response_schema
+            if response_schema is AGENT_EDIT_SCHEMA:
+                # Splice the pre-serialized schema bytes instead of re-walking the dict
+                gen_config["responseSchema"] = orjson.Fragment(_AGENT_EDIT_SCHEMA_BYTES)
+            else:
+                gen_config["responseSchema"] = response_schema
 
         payload: Dict[str, Any] = {
             "contents": [{"parts": parts}],
@@ -230,51 +494,56 @@ class GeminiService:
         if cached_content:
             payload["cachedContent"] = cached_content
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=120.0)
-            
-            if response.status_code != 200:
-                err_msg = response.text[:500] if len(response.text) > 500 else response.text
-                raise Exception(f"Gemini API Error: {response.status_code} - {err_msg}")
-            
-            result = response.json()
-            
-            try:
-                candidate = result["candidates"][0]
-                finish_reason = candidate.get("finishReason", "")
-                # Handle blocked/empty responses - raise specific error for fallback handling
-                content = candidate.get("content", {})
-                if not content or "parts" not in content:
-                    blocked_reasons = {
-                        "RECITATION": "Detected potential copyrighted content",
-                        "SAFETY": "Content filtered by safety settings",
-                        "OTHER": "Content blocked by filter",
-                    }
-                    msg = blocked_reasons.get(finish_reason, f"Empty response (finishReason: {finish_reason})")
-                    raise ContentBlockedError(msg, reason=finish_reason)
-
-                # Track cached vs non-cached tokens
-                usage = result.get("usageMetadata", {})
-                tokens = usage.get("totalTokenCount", 0)
-                cached_tokens = usage.get("cachedContentTokenCount", 0)
-                if cached_tokens > 0:
-                    print(f"Used {cached_tokens} cached tokens out of {tokens} total")
-                if finish_reason == "MAX_TOKENS":
-                    raise Exception(f"Response exceeded token limit. Try using a shorter document or simpler instruction. Used {tokens} tokens.")
-                
-                # Check if content exists and has parts
-                content = candidate.get("content", {})
-                parts = content.get("parts", [])
-                
-                if not parts or not parts[0].get("text"):
-                    raise Exception(f"Empty response from API. Finish reason: {finish_reason}")
-                
-                text = parts[0]["text"]
-                return text, tokens
-            except (TokenLimitError, ContentBlockedError):
-                raise
-            except Exception:
-                raise Exception(f"Failed to parse Gemini response: {result}")
+        async with self._api_slots:
+            response = await self._client.post(
+                url,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
+            )
+
+        if response.status_code != 200:
+            err_msg = response.text[:500] if len(response.text) > 500 else response.text
+            raise Exception(f"Gemini API Error: {response.status_code} - {err_msg}")
+
+        result = orjson.loads(response.content)
+
+        try:
+            candidate = result["candidates"][0]
+            finish_reason = candidate.get("finishReason", "")
+            # Handle blocked/empty responses - raise specific error for fallback handling
+            content = candidate.get("content", {})
+            if not content or "parts" not in content:
+                msg = _BLOCKED_REASONS.get(finish_reason, f"Empty response (finishReason: {finish_reason})")
+                raise ContentBlockedError(msg, reason=finish_reason)
+
+            # Track cached vs non-cached tokens
+            usage = result.get("usageMetadata", {})
+            tokens = usage.get("totalTokenCount", 0)
+            cached_tokens = usage.get("cachedContentTokenCount", 0)
+            if cached_tokens > 0:
+                print(f"Used {cached_tokens} cached tokens out of {tokens} total")
+            # Check if content exists and has parts
+            content = candidate.get("content", {})
+            parts = content.get("parts", [])
+
+            if finish_reason == "MAX_TOKENS":
+                # Surface the partial text so callers can salvage or retry
+                partial = parts[0].get("text", "") if parts else ""
+                raise TokenLimitError(
+                    f"Response exceeded token limit. Try using a shorter document or simpler instruction. Used {tokens} tokens.",
+                    partial_text=partial,
+                    tokens=tokens,
+                )
+
+            if not parts or not parts[0].get("text"):
+                raise Exception(f"Empty response from API. Finish reason: {finish_reason}")
+
+            text = parts[0]["text"]
+            return text, tokens
+        except (TokenLimitError, ContentBlockedError):
+            raise
+        except Exception:
+            raise Exception(f"Failed to parse Gemini response: {result}")
 
     async def _call_api(
         self,
@@ -286,57 +555,145 @@ class GeminiService:
         images: Optional[List[str]] = None,
         response_schema: Optional[Dict] = None,
         cached_content: Optional[str] = None,
+        resolved_key: Optional[str] = None,
     ) -> Tuple[str, int]:
-        if not self.gemini_api_key and not api_key:
+        # Callers that already resolved the key (e.g. batched chunk dispatch)
+        # pass it via resolved_key so we don't strip/branch twice per call.
+        key = resolved_key or self.get_api_key(api_key)
+        if not key:
             return self._dev_response(prompt), 0
-        return await self._call_gemini_api(
-            model, prompt, temperature, max_tokens,
-            api_key, images, response_schema, cached_content
-        )
+        try:
+            return await self._call_gemini_api(
+                model, prompt, temperature, max_tokens,
+                key, images, response_schema, cached_content
+            )
+        except TokenLimitError:
+            # Schema-constrained output is structurally valid but can still
+            # truncate; one retry with a doubled budget beats repairing JSON.
+            if response_schema and max_tokens < 8192:
+                return await self._call_gemini_api(
+                    model, prompt, temperature, min(max_tokens * 2, 8192),
+                    key, images, response_schema, cached_content
+                )
+            raise
+
+    async def _stream_gemini_api(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        key: str,
+        cached_content: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Stream a plain-text completion over SSE.
+
+        Yields (text_delta, tokens) pairs; tokens is 0 until the chunk that
+        carries usageMetadata (usually the last). Streaming gets the first
+        token back as soon as the model emits it and lets callers stop
+        reading early instead of waiting out a full truncated response.
+        Structured-output callers (agent_edit) stay on _call_gemini_api
+        since they need the complete JSON anyway.
+        """
+        url = f"{self.gemini_base_url}/models/{model}:streamGenerateContent?alt=sse&key={key}"
+        payload: Dict[str, Any] = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": temperature,
+                "maxOutputTokens": max_tokens,
+            },
+        }
+        if cached_content:
+            payload["cachedContent"] = cached_content
+
+        # The slot is held for the whole stream: an open stream is an
+        # in-flight request as far as the upstream quota is concerned
+        async with self._api_slots, self._client.stream(
+            "POST",
+            url,
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise Exception(
+                    f"Gemini API Error: {response.status_code} - "
+                    f"{body[:500].decode('utf-8', errors='replace')}"
+                )
+            emitted = False
+            finish_reason = ""
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                chunk = orjson.loads(line[6:])
+                tokens = chunk.get("usageMetadata", {}).get("totalTokenCount", 0)
+                candidates = chunk.get("candidates")
+                if not candidates:
+                    if tokens:
+                        yield "", tokens
+                    continue
+                finish_reason = candidates[0].get("finishReason") or finish_reason
+                parts = candidates[0].get("content", {}).get("parts")
+                text = parts[0].get("text", "") if parts else ""
+                if text:
+                    emitted = True
+                if text or tokens:
+                    yield text, tokens
+
+        # A blocked stream just ends: no parts arrive and the last chunk
+        # carries the finish reason. Surface it like the non-streaming
+        # path does instead of handing callers an empty string.
+        if not emitted and finish_reason in _BLOCKED_REASONS:
+            raise ContentBlockedError(
+                _BLOCKED_REASONS[finish_reason], reason=finish_reason
+            )
 
     def _dev_response(self, prompt: str) -> str:
-        if "autocomplete" in prompt.lower():
+        # Lowercase once instead of per containment check
+        p = prompt.lower()
+        if "autocomplete" in p:
             return "\\section{"
-        if "convert" in prompt.lower() or "latex" in prompt.lower():
-            return self._sample_latex()
-        if "edit" in prompt.lower() or "change" in prompt.lower():
-            return json.dumps({
-                "explanation": "Dev mode: Sample edit suggestion",
-                "changes": [{
-                    "start_line": 1,
-                    "end_line": 2,
-                    "original": "Original text",
-                    "replacement": "Improved text",
-                    "reason": "Dev mode suggestion"
-                }]
-            })
+        if "convert" in p or "latex" in p:
+            return _DEV_LATEX_RESPONSE
+        if "edit" in p or "change" in p:
+            return _DEV_EDIT_RESPONSE
         return "This is a development mode response."
-    
-    def _sample_latex(self) -> str:
-        return r"""\documentclass{article}
-\usepackage{amsmath}
-\usepackage{graphicx}
-\usepackage{geometry}
-
-\geometry{a4paper, margin=1in}
 
-\title{Sample Document}
-\author{UEA AI}
-\date{\today}
+    async def _call_autocomplete_fast(self, prompt: str, cached_content: Optional[str] = None) -> Tuple[str, int]:
+        """Fused fast path for the autocomplete hot loop.
 
-\begin{document}
-\maketitle
-
-\section{Introduction}
-This is a sample LaTeX document generated for development purposes.
-
-\section{Content}
-Lorem ipsum dolor sit amet, consectetur adipiscing elit.
-
-\section{Conclusion}
-This document demonstrates the basic LaTeX structure.
+        Skips the generic payload assembly in _call_api (image parts, safety
+        settings, schema handling) and parses the response with plain dict
+        gets - autocomplete can tolerate an empty suggestion on odd responses.
+        """
+        key = self.gemini_api_key
+        if not key:
+            return self._dev_response(prompt), 0
 
-\end{document}"""
+        url = f"{self.gemini_base_url}/models/{FLASH_MODEL}:generateContent?key={key}"
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": orjson.Fragment(_AUTOCOMPLETE_GEN_CONFIG_BYTES),
+        }
+        if cached_content:
+            payload["cachedContent"] = cached_content
+        async with self._api_slots:
+            response = await self._client.post(
+                url,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
+            )
+        if response.status_code != 200:
+            raise Exception(f"Gemini API Error: {response.status_code} - {response.text[:500]}")
+
+        result = orjson.loads(response.content)
+        candidates = result.get("candidates")
+        if not candidates:
+            return "", 0
+        parts = candidates[0].get("content", {}).get("parts")
+        text = parts[0].get("text", "") if parts else ""
+        tokens = result.get("usageMetadata", {}).get("totalTokenCount", 0)
+        return text, tokens
 
     async def autocomplete(self, context: str, cursor_pos: int, file_name: str) -> Tuple[str, int]:
         # Only use the last ~2000 chars of context to save tokens
@@ -344,17 +701,36 @@ This document demonstrates the basic LaTeX structure.
         if len(trimmed_context) > 2000:
             trimmed_context = trimmed_context[-2000:]
 
-        prompt = f"""You are a LaTeX expert providing intelligent autocomplete.
-
-Context (code before cursor):
-{trimmed_context}
-
-File: {file_name}
+        # Resolve the server-side preamble cache per call (the name has a
+        # TTL); creation runs in the background off the hot path, and a
+        # server refusal is negative-cached so it's attempted once
+        cached_name = None
+        if self.gemini_api_key:
+            cached_name = await self.prompt_cache.get(
+                _AUTOCOMPLETE_SYSTEM_PREAMBLE, FLASH_MODEL
+            )
+            if cached_name is None and not self.prompt_cache.is_negative(
+                _AUTOCOMPLETE_SYSTEM_PREAMBLE, FLASH_MODEL
+            ):
+                self._spawn_cache_create(
+                    _AUTOCOMPLETE_SYSTEM_PREAMBLE, FLASH_MODEL,
+                    self.gemini_api_key,
+                    display_name="autocomplete_preamble", enforce_min=False
+                )
 
-Provide a SINGLE short completion (1-2 lines max) that would logically follow.
-Return ONLY the completion text, nothing else. No explanations."""
+        if cached_name:
+            # Preamble lives server-side; only ship the dynamic context
+            prompt = _AUTOCOMPLETE_CONTEXT_TEMPLATE.format(
+                context=trimmed_context, file_name=file_name
+            )
+        else:
+            prompt = _AUTOCOMPLETE_PROMPT_TEMPLATE.format(
+                context=trimmed_context, file_name=file_name
+            )
 
-        text, tokens = await self._call_api(FLASH_MODEL, prompt, temperature=0.1, max_tokens=100)
+        text, tokens = await self._call_autocomplete_fast(
+            prompt, cached_content=cached_name
+        )
         return text.strip(), tokens
     
     async def generate_document(
@@ -453,23 +829,50 @@ Output COMPLETE compilable LaTeX. You MUST include \\end{{document}} at the end:
     async def chat(self, message: str, context: str,
                   model: str = "flash") -> Tuple[str, int]:
         model_name = FLASH_MODEL if model == "flash" else PRO_MODEL
-        
-        prompt = f"""You are a LaTeX expert assistant.
 
-Document context:
-{context[:2000]}
-
-User message: {message}
+        # Reserve room for the user's message inside the overall budget.
+        # Anchored windows vary per message and so miss the prompt cache,
+        # but the common head-slice case stays byte-stable.
+        budget = max(1000, _CHAT_CONTEXT_BUDGET - len(message))
+        context_block = _CHAT_CONTEXT_TEMPLATE.format(
+            context=_chat_context_window(context, message, budget)
+        )
+        message_block = _CHAT_MESSAGE_TEMPLATE.format(message=message)
+
+        # Repeated chats about the same document hit the server-side cache
+        # and only re-send the message suffix. A cache miss doesn't block the
+        # current turn: creation runs in the background and the next turn
+        # picks up the cache name.
+        cached = None
+        if self.gemini_api_key and len(context_block) >= _CACHE_MIN_CHARS:
+            cached = await self.prompt_cache.get(context_block, model_name)
+            if not cached:
+                self._spawn_cache_create(
+                    context_block, model_name, self.gemini_api_key,
+                    display_name="chat_context"
+                )
 
-Provide helpful, concise assistance. If suggesting code changes, show the LaTeX code clearly."""
+        prompt = message_block if cached else f"{context_block}\n\n{message_block}"
+        if not self.gemini_api_key:
+            return self._dev_response(prompt), 0
 
-        return await self._call_api(model_name, prompt, temperature=0.3, max_tokens=1024)
+        # Stream so HTTP/2 returns the first token immediately; a truncated
+        # answer keeps whatever arrived instead of erroring out wholesale.
+        pieces: List[str] = []
+        tokens = 0
+        async for delta, chunk_tokens in self._stream_gemini_api(
+            model_name, prompt, 0.3, 1024, self.gemini_api_key,
+            cached_content=cached
+        ):
+            pieces.append(delta)
+            if chunk_tokens:
+                tokens = chunk_tokens
+        return "".join(pieces), tokens
     
-    async def agent_edit(self, document: str, instruction: str,
-                        model: str = "pro",
-                        selection: Optional[dict] = None) -> Tuple[Dict[str, Any], int]:
-        model_name = FLASH_MODEL if model == "flash" else PRO_MODEL
-
+    async def _agent_edit_prompt(self, document: str, instruction: str,
+                                 model_name: str,
+                                 selection: Optional[dict]) -> Tuple[str, Optional[str]]:
+        """Build the agent-edit prompt, returning (prompt, cached_content)."""
         # Truncate document if too long to prevent token limit issues
         max_doc_length = 15000  # characters
         truncated = False
@@ -487,61 +890,160 @@ IMPORTANT - The user has selected lines {selection['start_line']}-{selection['en
 Focus your changes on these selected lines. The user's instruction likely refers to this selection.
 """
 
-        prompt = f"""You are an AI agent that edits LaTeX documents.
-
-Document:
-{document}
-{"[Document truncated due to length]" if truncated else ""}
-{selection_context}
-User instruction: {instruction}
+        doc_block = _AGENT_EDIT_DOC_TEMPLATE.format(
+            document=document,
+            truncated_note="[Document truncated due to length]" if truncated else "",
+        )
+        instruction_block = _AGENT_EDIT_INSTRUCTION_TEMPLATE.format(
+            selection_context=selection_context,
+            instruction=instruction,
+        )
 
-Analyze the document and provide specific changes. Return a JSON object with:
-{{
-  "explanation": "Brief explanation of what you will do",
-  "changes": [
-    {{
-      "start_line": <line number>,
-      "end_line": <line number>,
-      "original": "exact original text",
-      "replacement": "new text",
-      "reason": "why this change"
-    }}
-  ]
-}}
+        # Cache the document prefix so repeated edits of the same document
+        # only pay for the instruction tokens.
+        cached = None
+        if self.gemini_api_key:
+            cached = await self._create_cached_content(
+                doc_block, model_name, self.gemini_api_key,
+                display_name="agent_edit_doc"
+            )
 
-Return ONLY valid JSON, no markdown formatting. Keep your response concise."""
+        prompt = instruction_block if cached else f"{doc_block}{instruction_block}"
+        return prompt, cached
+
+    def _parse_agent_edit_response(self, text: str) -> Dict[str, Any]:
+        """Parse the model's JSON reply into the result dict callers expect."""
+        # Clean potential markdown code blocks
+        clean_text = text.strip()
+        if clean_text.startswith("```"):
+            parts = clean_text.split("```")
+            if len(parts) >= 2:
+                clean_text = parts[1]
+                if clean_text.startswith("json"):
+                    clean_text = clean_text[4:].strip()
+
+        # Fast bail before parsing: empty or obviously-non-JSON responses
+        # (e.g. truncated at the token limit) don't deserve a parse attempt.
+        if not clean_text or clean_text[0] != "{":
+            return {
+                "explanation": "Empty or non-JSON response from AI",
+                "changes": [],
+                "raw_response": text[:500] if text else "No response"
+            }
 
-        text, tokens = await self._call_api(model_name, prompt, temperature=0.2, max_tokens=4096)
-        
-        # Parse JSON from response
         try:
-            # Clean potential markdown code blocks
-            clean_text = text.strip()
-            if clean_text.startswith("```"):
-                parts = clean_text.split("```")
-                if len(parts) >= 2:
-                    clean_text = parts[1]
-                    if clean_text.startswith("json"):
-                        clean_text = clean_text[4:].strip()
-            
-            result = json.loads(clean_text)
-            
-            # Validate response structure
-            if not isinstance(result, dict):
-                raise ValueError("Response is not a JSON object")
-            if "explanation" not in result:
-                result["explanation"] = "AI suggested changes"
-            if "changes" not in result:
-                result["changes"] = []
-            
-            return result, tokens
-        except (json.JSONDecodeError, ValueError) as e:
+            result = orjson.loads(clean_text)
+        except orjson.JSONDecodeError as e:
             # Fallback response with more info
             return {
                 "explanation": f"Could not parse AI response: {str(e)[:100]}",
                 "changes": [],
-                "raw_response": text[:500] if text else "No response"
-            }, tokens
+                "raw_response": text[:500]
+            }
+
+        # Validate response structure - the first-char check guarantees a dict
+        if "explanation" not in result:
+            result["explanation"] = "AI suggested changes"
+        if "changes" not in result:
+            result["changes"] = []
+
+        return result
+
+    async def agent_edit(self, document: str, instruction: str,
+                        model: str = "pro",
+                        selection: Optional[dict] = None) -> Tuple[Dict[str, Any], int]:
+        model_name = FLASH_MODEL if model == "flash" else PRO_MODEL
+
+        prompt, cached = await self._agent_edit_prompt(
+            document, instruction, model_name, selection
+        )
+        text, tokens = await self._call_api(
+            model_name, prompt, temperature=0.2, max_tokens=4096,
+            cached_content=cached
+        )
+        return self._parse_agent_edit_response(text), tokens
+
+    async def agent_edit_stream(self, document: str, instruction: str,
+                                model: str = "pro",
+                                selection: Optional[dict] = None
+                                ) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming agent_edit for the SSE endpoint.
+
+        Yields {"type": "chunk", "text": delta} as the model writes so the
+        client can show progress, then a final {"type": "result", "data":
+        result, "tokens": n} once the accumulated JSON parses. Decode
+        overlaps with display instead of the client staring at a spinner
+        for the full completion.
+        """
+        model_name = FLASH_MODEL if model == "flash" else PRO_MODEL
+
+        prompt, cached = await self._agent_edit_prompt(
+            document, instruction, model_name, selection
+        )
+        if not self.gemini_api_key:
+            text = self._dev_response(prompt)
+            yield {"type": "chunk", "text": text}
+            yield {"type": "result", "data": self._parse_agent_edit_response(text), "tokens": 0}
+            return
+
+        pieces: List[str] = []
+        tokens = 0
+        async for delta, chunk_tokens in self._stream_gemini_api(
+            model_name, prompt, 0.2, 4096, self.gemini_api_key,
+            cached_content=cached
+        ):
+            if delta:
+                pieces.append(delta)
+                yield {"type": "chunk", "text": delta}
+            if chunk_tokens:
+                tokens = chunk_tokens
+
+        yield {
+            "type": "result",
+            "data": self._parse_agent_edit_response("".join(pieces)),
+            "tokens": tokens,
+        }
+
+    def _try_repair_json(self, text: str) -> Optional[Dict[str, Any]]:
+        """Salvage complete operation objects from a truncated response.
+
+        Pulls whole objects out of the operations array one at a time with
+        json.JSONDecoder.raw_decode. Unlike a brace-counting scan this is
+        immune to braces inside string values, which are everywhere in LaTeX
+        content (\\textbf{...} etc).
+        """
+        if not text:
+            return None
+
+        m = _OPS_START_RE.search(text)
+        if not m:
+            return None
+
+        decoder = json.JSONDecoder()
+        idx = m.end()
+        n = len(text)
+        ops = []
+        while idx < n:
+            # Skip whitespace and commas between array elements
+            while idx < n and text[idx] in ' \t\r\n,':
+                idx += 1
+            if idx >= n or text[idx] != '{':
+                break
+            try:
+                obj, idx = decoder.raw_decode(text, idx)
+            except json.JSONDecodeError:
+                # Last object was cut off mid-stream; keep what we have
+                break
+            ops.append(obj)
+
+        if not ops:
+            return None
+
+        expl = _EXPL_RE.search(text)
+        return {
+            "explanation": expl.group(1) if expl else "Recovered partial response",
+            "operations": ops,
+        }
 
     def _process_operations(self, operations: List[Dict], lines: List[str]) -> List[Dict]:
         """Convert operations into concrete changes with original/replacement text."""
@@ -653,30 +1155,20 @@ Return ONLY valid JSON, no markdown formatting. Keep your response concise."""
         current_start = 0
         total_lines = len(lines)
 
-        # Patterns that indicate good split points
-        section_patterns = [
-            r'\\section\{',
-            r'\\subsection\{',
-            r'\\chapter\{',
-            r'\\begin\{document\}',
-            r'\\end\{document\}',
-            r'^\\begin\{(figure|table|equation|align|itemize|enumerate)\}',
-            r'^$',  # Empty lines
-        ]
-        section_regex = re.compile('|'.join(section_patterns))
+        # One linear scan for boundary lines up front; each chunk end then
+        # bisects into this list instead of re-matching up to 30 lines
+        boundaries = [i for i, line in enumerate(lines) if _SECTION_REGEX.search(line)]
 
         while current_start < total_lines:
             chunk_end = min(current_start + max_lines_per_chunk, total_lines)
 
-            # If not at the end, try to find a natural break point
+            # If not at the end, try to find a natural break point: the
+            # closest boundary at or before chunk_end, but no more than 30
+            # lines back and at least 20 lines into the chunk
             if chunk_end < total_lines:
-                # Look backwards for a good split point
-                best_split = chunk_end
-                for i in range(chunk_end, max(current_start + 20, chunk_end - 30), -1):
-                    if i < total_lines and section_regex.search(lines[i]):
-                        best_split = i
-                        break
-                chunk_end = best_split
+                idx = bisect.bisect_right(boundaries, chunk_end) - 1
+                if idx >= 0 and boundaries[idx] > max(current_start + 20, chunk_end - 30):
+                    chunk_end = boundaries[idx]
 
             chunks.append({
                 'start_line': current_start + 1,  # 1-indexed
@@ -705,13 +1197,22 @@ Return ONLY valid JSON, no markdown formatting. Keep your response concise."""
         context_before = max(0, start_line - 4)
         context_after = min(len(full_lines), chunk['end_line'] + 3)
 
-        # Build the view
-        view_lines = []
+        # Build the view, stopping at a fixed character budget so pathological
+        # long lines can't balloon the prompt (or transient memory).
+        view_parts = []
+        view_size = 0
         for i in range(context_before, context_after):
             prefix = ">>>" if start_line <= i + 1 <= chunk['end_line'] else "   "
-            view_lines.append(f"{prefix}{i+1:4d}| {full_lines[i]}")
+            # %-formatting with simple specs beats f-strings with width
+            # specifiers in CPython, and this runs once per document line
+            piece = "%s%4d| %s\n" % (prefix, i + 1, full_lines[i])
+            if view_size + len(piece) > 12000:
+                view_parts.append("... (truncated)")
+                break
+            view_parts.append(piece)
+            view_size += len(piece)
 
-        numbered_chunk = '\n'.join(view_lines)
+        numbered_chunk = ''.join(view_parts)
 
         prompt = f"""You are a LaTeX formatting assistant. TRANSFORM and apply LaTeX markup to the marked lines.
 
@@ -743,7 +1244,7 @@ JSON with explanation and operations:"""
                 prompt,
                 temperature=0.1,
                 max_tokens=2048,
-                api_key=api_key,
+                resolved_key=api_key,
                 images=images if chunk['start_line'] == 1 else None,  # Only send images to first chunk
                 response_schema=AGENT_EDIT_SCHEMA
             )
@@ -760,7 +1261,7 @@ JSON with explanation and operations:"""
             return [], e.tokens
 
         try:
-            result = json.loads(text)
+            result = orjson.loads(text)
             operations = result.get("operations", [])
 
             # Filter operations to only include those in this chunk's range
@@ -770,7 +1271,7 @@ JSON with explanation and operations:"""
             ]
 
             return valid_ops, tokens
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             repaired = self._try_repair_json(text)
             if repaired:
                 operations = repaired.get("operations", [])
@@ -800,39 +1301,62 @@ JSON with explanation and operations:"""
 
         # Chunk the document (even small docs get chunked when called as fallback)
         chunks = self._chunk_document(lines, max_lines_per_chunk)
+
+        # Cheap client-side pre-filter: when the instruction names concrete
+        # anchors (\commands or structural keywords), a chunk containing none
+        # of them can't be an edit target - skip its API round-trip entirely.
+        # Instructions with no recognizable anchors fall through untouched,
+        # and if no chunk matches at all we assume the anchors were a red
+        # herring and process everything.
+        terms = set()
+        for anchor in _ANCHOR_KEYWORD_RE.findall(instruction.lower()):
+            terms.add(anchor.lstrip('\\'))
+            terms.update(_ANCHOR_SYNONYMS.get(anchor, ()))
+        if terms:
+            targeted = [
+                c for c in chunks
+                if any(t in '\n'.join(c['lines']).lower() for t in terms)
+            ]
+            if targeted and len(targeted) < len(chunks):
+                print(f"Anchor pre-filter: {len(chunks) - len(targeted)} of {len(chunks)} chunks skipped")
+                chunks = targeted
+
         print(f"Processing {len(chunks)} chunks for {len(lines)} lines")
 
-        # Process chunks in parallel (with concurrency limit)
-        semaphore = asyncio.Semaphore(3)  # Max 3 concurrent requests
+        # Process chunks in parallel (with tunable concurrency limit)
+        semaphore = asyncio.Semaphore(Config.GEMINI_CHUNK_CONCURRENCY)
 
         async def process_with_limit(chunk):
             async with semaphore:
-                return await self._process_chunk(chunk, instruction, lines, model_name, key, images)
+                # Retry rate-limited/unavailable chunks with exponential jitter
+                for attempt in range(3):
+                    try:
+                        return await self._process_chunk(chunk, instruction, lines, model_name, key, images)
+                    except Exception as e:
+                        msg = str(e)
+                        if attempt < 2 and ("429" in msg or "503" in msg):
+                            await asyncio.sleep(2 ** attempt + random.random())
+                            continue
+                        raise
 
         # Run all chunks
         results = await asyncio.gather(*[process_with_limit(c) for c in chunks])
 
-        # Merge operations and count tokens
-        all_operations = []
-        total_tokens = 0
-        for ops, tokens in results:
-            all_operations.extend(ops)
-            total_tokens += tokens
-
-        # Sort by line number and remove duplicates
-        all_operations.sort(key=lambda x: (x.get('line', 0), x.get('start_char', 0)))
-
-        # Remove duplicate operations on same line
-        seen_lines = set()
-        unique_ops = []
-        for op in all_operations:
-            line_key = (op.get('line'), op.get('type'), op.get('start_char', 0))
-            if line_key not in seen_lines:
-                seen_lines.add(line_key)
-                unique_ops.append(op)
-
-        # Process operations into changes
-        processed = self._process_operations(unique_ops, lines)
+        total_tokens = sum(tokens for _, tokens in results)
+
+        # Each chunk emits its ops in document order already (sorting an
+        # already-ordered list is a near-free linear pass for timsort), so an
+        # O(N log k) k-way merge beats flattening and re-sorting the whole
+        # list. The merged iterator streams straight into groupby for dedup.
+        dedup_key = lambda op: (op.get('line', 0), op.get('type', ''), op.get('start_char', 0))
+        merged = heapq.merge(
+            *(sorted(ops, key=dedup_key) for ops, _ in results), key=dedup_key
+        )
+        unique_ops = [next(grp) for _, grp in itertools.groupby(merged, key=dedup_key)]
+
+        # Process operations into changes off the event loop - for large
+        # documents this is several ms of pure-Python string slicing
+        processed = await asyncio.to_thread(self._process_operations, unique_ops, lines)
 
         return {
             "explanation": f"Processed {len(chunks)} sections, found {len(processed)} changes",
@@ -1,161 +1,46 @@
 import os
+import re
+import asyncio
+import base64
+import contextlib
+import functools
+import hashlib
 import tempfile
-import subprocess
+import time
 import shutil
-from typing import Tuple, Optional, List, Dict
+from types import MappingProxyType
+from typing import Tuple, Optional, List, Dict, Union
 from config import Config
 
-class LaTeXService:
-    def __init__(self):
-        self.compiler = Config.LATEX_COMPILER
-        self.timeout = Config.LATEX_TIMEOUT
-        self.compilers = ["pdflatex", "xelatex", "lualatex"]
-    
-    async def compile(self, files: List[Dict], main_file: str) -> Tuple[bool, Optional[bytes], Optional[str]]:
-        temp_dir = tempfile.mkdtemp()
-        
-        try:
+# Citation commands that would make bibtex worth running, matched against the
+# source before compiling so citation-free documents never touch the .aux
+_CITATION_RE = re.compile(r'\\(?:no)?cite[pt*]?\b|\\bibliography\b')
 
-            for f in files:
-                file_path = os.path.join(temp_dir, f["name"])
-                
-                # Create subdirectories if needed
-                os.makedirs(os.path.dirname(file_path), exist_ok=True) if os.path.dirname(file_path) else None
-                
-                # Handle binary vs text files
-                if f.get("type") in ["png", "jpg", "pdf"]:
-                    # For binary files, content should be base64
-                    import base64
-                    content = base64.b64decode(f["content"])
-                    with open(file_path, "wb") as fp:
-                        fp.write(content)
-                else:
-                    with open(file_path, "w", encoding="utf-8") as fp:
-                        fp.write(f["content"])
-            
-            main_path = os.path.join(temp_dir, main_file)
-            if not os.path.exists(main_path):
-                return False, None, f"Main file not found: {main_file}"
-            
-            # Determine compiler based on document
-            compiler = self._detect_compiler(files, main_file)
-            aux_file = os.path.join(temp_dir, main_file.replace(".tex", ".aux"))
+# Engine indicators, alternated so the content is traversed once per engine
+# instead of once per package name
+_XELATEX_RE = re.compile(r'fontspec|unicode-math|polyglossia')
+_LUALATEX_RE = re.compile(r'luacode|directlua')
 
-            # First pass
-            result = subprocess.run(
-                [compiler, "-interaction=nonstopmode", "-halt-on-error", main_file],
-                cwd=temp_dir,
-                capture_output=True,
-                text=True,
-                timeout=self.timeout
-            )
+@functools.lru_cache(maxsize=256)
+def _detect_compiler_cached(preamble_prefix: str, default: str) -> str:
+    # XeLaTeX indicators
+    if _XELATEX_RE.search(preamble_prefix):
+        return "xelatex"
 
-            # Check if bibtex is needed
-            needs_rerun = False
-            if os.path.exists(aux_file):
-                with open(aux_file, "r") as f:
-                    aux_content = f.read()
-                if "\\citation" in aux_content:
-                    subprocess.run(
-                        ["bibtex", main_file.replace(".tex", "")],
-                        cwd=temp_dir,
-                        capture_output=True,
-                        timeout=self.timeout
-                    )
-                    needs_rerun = True
-
-            # Only run second pass if references/citations exist
-            if needs_rerun or (result.stdout and "Rerun" in result.stdout):
-                result = subprocess.run(
-                    [compiler, "-interaction=nonstopmode", "-halt-on-error", main_file],
-                    cwd=temp_dir,
-                    capture_output=True,
-                    text=True,
-                    timeout=self.timeout
-                )
-            
-            # Check for PDF output
-            pdf_path = os.path.join(temp_dir, main_file.replace(".tex", ".pdf"))
-            
-            if os.path.exists(pdf_path):
-                with open(pdf_path, "rb") as f:
-                    pdf_content = f.read()
-                return True, pdf_content, None
-            else:
-                # Extract error from log
-                log_path = os.path.join(temp_dir, main_file.replace(".tex", ".log"))
-                error_msg = self._extract_error(log_path) if os.path.exists(log_path) else result.stderr
-                return False, None, error_msg or "PDF generation failed"
-                
-        except subprocess.TimeoutExpired:
-            return False, None, f"Compilation timed out after {self.timeout} seconds"
-        except FileNotFoundError as e:
-            return False, None, f"LaTeX compiler not found: {compiler}. Install TeX Live or MiKTeX."
-        except Exception as e:
-            return False, None, str(e)
-        finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-    
-    def _detect_compiler(self, files: List[Dict], main_file: str) -> str:
-        main_content = ""
-        for f in files:
-            if f["name"] == main_file:
-                main_content = f.get("content", "")
-                break
-        
-        # XeLaTeX indicators
-        if any(pkg in main_content for pkg in ["fontspec", "unicode-math", "polyglossia"]):
-            return "xelatex"
-        
-        # LuaLaTeX indicators
-        if "luacode" in main_content or "directlua" in main_content:
-            return "lualatex"
-        
-        return self.compiler
-    
-    def _extract_error(self, log_path: str) -> str:
-        try:
-            with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-            
-            # Look for error patterns
-            errors = []
-            lines = content.split("\n")
-            
-            for i, line in enumerate(lines):
-                if line.startswith("!"):
-                    # Found an error
-                    error_lines = [line]
-                    # Get context
-                    for j in range(1, min(5, len(lines) - i)):
-                        if lines[i + j].startswith("l."):
-                            error_lines.append(lines[i + j])
-                            break
-                        error_lines.append(lines[i + j])
-                    errors.append("\n".join(error_lines))
-            
-            if errors:
-                return "\n\n".join(errors[:3])  # Return first 3 errors
-            
-            # Look for warnings if no errors
-            if "Output written on" not in content:
-                return "Compilation failed. Check LaTeX syntax."
-            
-            return None
-        except:
-            return "Could not read compilation log"
-    
-    def get_sample_templates(self) -> Dict[str, str]:
-        return {
-            "journal": self._journal_template(),
-            "problem_set": self._problem_set_template(),
-            "thesis": self._thesis_template(),
-            "report": self._report_template(),
-            "letter": self._letter_template()
-        }
-    
-    def _journal_template(self) -> str:
-        return r"""\documentclass[twocolumn]{article}
+    # LuaLaTeX indicators
+    if _LUALATEX_RE.search(preamble_prefix):
+        return "lualatex"
+
+    return default
+
+# A '!' error line, up to 4 context lines, then optionally the l.<n> line
+# marking the source position; mirrors the old per-line scan in one pass
+_LATEX_ERROR_RE = re.compile(r'(?m)^!.*(?:\n(?!l\.).*){0,4}(?:\nl\..*)?')
+
+# Project ids safe to use as directory names for the persistent build dirs
+_SAFE_ID_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+_JOURNAL_TPL = r"""\documentclass[twocolumn]{article}
 \usepackage{amsmath,amssymb}
 \usepackage{graphicx}
 \usepackage{hyperref}
@@ -191,8 +76,7 @@ Conclusions.
 
 \end{document}"""
 
-    def _problem_set_template(self) -> str:
-        return r"""\documentclass{article}
+_PROBLEM_SET_TPL = r"""\documentclass{article}
 \usepackage{amsmath,amssymb,amsthm}
 \usepackage{enumitem}
 \usepackage[margin=1in]{geometry}
@@ -217,8 +101,7 @@ Your solution here.
 
 \end{document}"""
 
-    def _thesis_template(self) -> str:
-        return r"""\documentclass[12pt]{report}
+_THESIS_TPL = r"""\documentclass[12pt]{report}
 \usepackage{amsmath,amssymb}
 \usepackage{graphicx}
 \usepackage{hyperref}
@@ -254,8 +137,7 @@ Conclusions.
 
 \end{document}"""
 
-    def _report_template(self) -> str:
-        return r"""\documentclass{article}
+_REPORT_TPL = r"""\documentclass{article}
 \usepackage{graphicx}
 \usepackage{hyperref}
 \usepackage[margin=1in]{geometry}
@@ -281,8 +163,7 @@ Recommendations.
 
 \end{document}"""
 
-    def _letter_template(self) -> str:
-        return r"""\documentclass{letter}
+_LETTER_TPL = r"""\documentclass{letter}
 \usepackage[margin=1in]{geometry}
 
 \signature{Your Name}
@@ -300,4 +181,421 @@ Letter body text.
 \end{letter}
 \end{document}"""
 
+# Built once at import; templates are static so every caller shares the
+# same read-only mapping instead of re-materializing ~3KB of strings
+_SAMPLE_TEMPLATES = MappingProxyType({
+    "journal": _JOURNAL_TPL,
+    "problem_set": _PROBLEM_SET_TPL,
+    "thesis": _THESIS_TPL,
+    "report": _REPORT_TPL,
+    "letter": _LETTER_TPL,
+})
+
+class LaTeXService:
+    def __init__(self):
+        self.compiler = Config.LATEX_COMPILER
+        self.timeout = Config.LATEX_TIMEOUT
+        self.compilers = ["pdflatex", "xelatex", "lualatex"]
+        # Precompiled preamble formats, keyed by preamble hash (see
+        # _get_preamble_fmt). Survives restarts so edit loops stay warm.
+        self.fmt_cache_dir = os.path.join(
+            os.path.expanduser("~"), ".cache", "uea-latex"
+        )
+        self._fmt_failed = set()
+        # Content hashes of files already written into each persistent
+        # project dir, so unchanged inputs skip their rewrite entirely
+        self._project_hashes: Dict[str, Dict[str, str]] = {}
+        # Last settled .aux hash per persistent dir, for skipping bibtex
+        # and rerun passes when references haven't moved
+        self._stable_aux: Dict[str, str] = {}
+        # Cap concurrent compiles at CPU count: each job is a full pdflatex
+        # process, and oversubscribing just makes every compile slower
+        self._compile_slots = asyncio.Semaphore(os.cpu_count() or 2)
+        # One lock per persistent project dir; compiles sharing a dir run
+        # the same jobname and must not overlap (see _project_lock)
+        self._project_locks: Dict[str, asyncio.Lock] = {}
+
+    def _project_lock(self, project_id: Optional[str]):
+        """Serialize compiles that share a persistent build dir.
+
+        Editor auto-compile overlapping a /download-pdf click runs two
+        compiles with the same project_id; unlocked, both pdflatex jobs
+        share one directory and jobname and clobber each other's
+        .aux/.pdf. Anonymous compiles get throwaway dirs, so they pass
+        through unlocked.
+        """
+        if project_id and _SAFE_ID_RE.match(project_id):
+            return self._project_locks.setdefault(project_id, asyncio.Lock())
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def _read_bytes(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        try:
+            with open(path, "rb") as f:
+                return hashlib.blake2b(
+                    f.read(), digest_size=16, usedforsecurity=False
+                ).hexdigest()
+        except OSError:
+            return ""
+
+    @staticmethod
+    def _write_file(path: str, content, binary: bool):
+        if binary:
+            with open(path, "wb") as fp:
+                fp.write(content)
+        else:
+            with open(path, "w", encoding="utf-8") as fp:
+                fp.write(content)
+
+    async def _run(self, args: List[str], cwd: str) -> Tuple[int, str, str]:
+        """Run one compiler/bibtex invocation without blocking the event loop.
+
+        Returns (returncode, stdout, stderr) decoded leniently - TeX logs
+        are not reliably UTF-8. Kills the process on timeout and re-raises
+        so callers see asyncio.TimeoutError.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(), timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.communicate()
+            raise
+        return (
+            proc.returncode,
+            stdout.decode("utf-8", "ignore"),
+            stderr.decode("utf-8", "ignore"),
+        )
+
+    async def _get_preamble_fmt(
+        self, temp_dir: str, main_file: str, main_content: str, compiler: str
+    ) -> Optional[str]:
+        """Build or fetch a precompiled preamble format for main_file.
+
+        Parsing the preamble (packages, fonts, geometry) dominates compile
+        time for small documents, and we pay it on every pass. mylatexformat
+        dumps everything before \\begin{document} into a .fmt once; passing
+        -fmt=<name> on later runs skips straight to the body. Returns the
+        fmt job name, or None when a format can't be built (no preamble,
+        mylatexformat missing, or a previous attempt failed).
+        """
+        if "\\begin{document}" not in main_content:
+            return None
+
+        preamble = main_content.split("\\begin{document}", 1)[0]
+        h = hashlib.blake2b(digest_size=16, usedforsecurity=False)
+        h.update(compiler.encode())
+        h.update(preamble.encode("utf-8", "ignore"))
+        name = "fmt-" + h.hexdigest()
+        if name in self._fmt_failed:
+            return None
+
+        cached = os.path.join(self.fmt_cache_dir, name + ".fmt")
+        local = os.path.join(temp_dir, name + ".fmt")
+        if os.path.exists(cached):
+            shutil.copyfile(cached, local)
+            return name
+
+        try:
+            returncode, _, _ = await self._run(
+                [compiler, "-ini", "-interaction=nonstopmode",
+                 f"-jobname={name}", f"&{compiler}", "mylatexformat.ltx",
+                 main_file],
+                temp_dir
+            )
+            if returncode == 0 and os.path.exists(local):
+                os.makedirs(self.fmt_cache_dir, exist_ok=True)
+                shutil.copyfile(local, cached)
+                return name
+        except (asyncio.TimeoutError, FileNotFoundError, OSError):
+            pass
+        self._fmt_failed.add(name)
+        return None
+
+    def _evict_stale_project_dirs(self, work_root: str, max_age: float = 86400.0):
+        """Drop persistent project dirs untouched for a day.
+
+        Called opportunistically from persistent compiles rather than a
+        dedicated reaper - compiles are the only thing that makes the dirs
+        grow, so that's often enough.
+        """
+        try:
+            now = time.time()
+            for entry in os.scandir(work_root):
+                if entry.is_dir() and now - entry.stat().st_mtime > max_age:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    self._project_hashes.pop(entry.path, None)
+                    self._stable_aux.pop(entry.path, None)
+        except OSError:
+            pass
+
+    async def compile(
+        self, files: List[Dict], main_file: str, project_id: Optional[str] = None
+    ) -> Tuple[bool, Optional[bytes], Optional[str]]:
+        async with self._compile_slots, self._project_lock(project_id):
+            return await self._compile(files, main_file, project_id)
+
+    async def warm_up(self):
+        """Compile a throwaway document once at startup.
+
+        The first pdflatex run on a fresh container pays format loading
+        and the kpathsea stat storm cold; doing it in the background at
+        boot means the first real request finds the OS caches warm.
+        Failures are ignored - a box without TeX installed just reports
+        the usual error on first use.
+        """
+        files = [{
+            "name": "main.tex",
+            "content": "\\documentclass{article}\\begin{document}x\\end{document}",
+            "type": "tex",
+        }]
+        try:
+            await self.compile(files, "main.tex")
+        except Exception:
+            pass
+
+    async def compile_to_file(
+        self, files: List[Dict], main_file: str, project_id: Optional[str] = None
+    ) -> Tuple[bool, Optional[str], Optional[str]]:
+        """Compile and return the PDF's filesystem path instead of its bytes.
+
+        Lets HTTP callers hand the path to FileResponse, which serves it via
+        sendfile(2) - the PDF never gets copied into the Python heap. The
+        returned file is the caller's to delete once served.
+        """
+        async with self._compile_slots, self._project_lock(project_id):
+            return await self._compile(files, main_file, project_id, return_path=True)
+
+    async def _compile(
+        self, files: List[Dict], main_file: str, project_id: Optional[str] = None,
+        return_path: bool = False
+    ) -> Tuple[bool, Union[bytes, str, None], Optional[str]]:
+        # pdflatex does hundreds of small reads/writes per compile (.aux,
+        # .toc, .log, style files); a tmpfs build dir turns all of that into
+        # memory traffic. The PDF is read out before cleanup, so nothing
+        # needs to survive the directory.
+        build_root = Config.LATEX_TMPFS if os.path.isdir(Config.LATEX_TMPFS) else None
+
+        # With a project id, reuse a persistent build dir so .aux/.toc/.bbl
+        # (and the local .fmt) carry over between compiles of the same
+        # project - the edit-loop case - instead of starting cold each time
+        persistent = bool(project_id and _SAFE_ID_RE.match(project_id))
+        if persistent:
+            work_root = Config.LATEX_WORK_DIR or os.path.join(
+                build_root or tempfile.gettempdir(), "uea-latex-work"
+            )
+            temp_dir = os.path.join(work_root, project_id)
+            os.makedirs(temp_dir, exist_ok=True)
+            os.utime(temp_dir)
+            self._evict_stale_project_dirs(work_root)
+        else:
+            temp_dir = tempfile.mkdtemp(dir=build_root)
+
+        try:
+
+            # Stage every write first, create directories once, then fan the
+            # actual writes out to threads - for many-file projects the
+            # open/write/close syscall latency parallelizes well
+            hashes = self._project_hashes.setdefault(temp_dir, {}) if persistent else None
+            writes = []
+            staged_hashes = []
+            for f in files:
+                file_path = os.path.join(temp_dir, f["name"])
+                if f.get("type") in ["png", "jpg", "pdf"]:
+                    # Binary content arrives as base64 str; pass raw bytes
+                    # through untouched so callers can skip the round-trip
+                    content = f["content"]
+                    if isinstance(content, str):
+                        content = base64.b64decode(content)
+                    binary = True
+                else:
+                    content = f["content"]
+                    binary = False
+
+                if hashes is not None:
+                    raw = content if binary else content.encode("utf-8", "ignore")
+                    digest = hashlib.blake2b(
+                        raw, digest_size=16, usedforsecurity=False
+                    ).hexdigest()
+                    if hashes.get(file_path) == digest and os.path.exists(file_path):
+                        continue
+                    # The .aux only records \citation/\bibdata lines, so an
+                    # edited .bib/.bst leaves it byte-identical while the
+                    # .bbl on disk goes stale - drop the skip key so bibtex
+                    # reruns against the new bibliography
+                    if f["name"].lower().endswith((".bib", ".bst")):
+                        self._stable_aux.pop(temp_dir, None)
+                    staged_hashes.append((file_path, digest))
+
+                writes.append((file_path, content, binary))
+
+            for d in {os.path.dirname(p) for p, _, _ in writes}:
+                if d:
+                    os.makedirs(d, exist_ok=True)
+
+            await asyncio.gather(
+                *(asyncio.to_thread(self._write_file, *w) for w in writes)
+            )
+
+            # Record digests only once the writes have landed; publishing
+            # one early would let a later compile skip the rewrite of a
+            # file whose write failed partway
+            if hashes is not None:
+                for file_path, digest in staged_hashes:
+                    hashes[file_path] = digest
+
+
+            main_path = os.path.join(temp_dir, main_file)
+            if not os.path.exists(main_path):
+                return False, None, f"Main file not found: {main_file}"
+            
+            # Determine compiler based on document - resolve the main file's
+            # content once here; detection and the fmt cache both need it
+            main_content = next(
+                (f.get("content", "") for f in files if f["name"] == main_file), ""
+            )
+            if not isinstance(main_content, str):
+                main_content = ""
+            compiler = self._detect_compiler(main_content)
+            aux_file = os.path.join(temp_dir, main_file.replace(".tex", ".aux"))
+
+            # Reuse a precompiled preamble format when one exists (or can be
+            # built); every pass below then skips preamble parsing entirely
+            fmt_name = await self._get_preamble_fmt(temp_dir, main_file, main_content, compiler)
+            fmt_args = [f"-fmt={fmt_name}"] if fmt_name else []
+
+            # Non-final passes only exist for their .aux/.toc/.bbl side
+            # effects; -draftmode skips PDF shipout (and image/compression
+            # work) entirely, so they cost a fraction of a full pass
+            draft_args = ["-interaction=batchmode", "-halt-on-error", "-draftmode"]
+
+            # First pass (draft): resolve labels and collect citations
+            returncode, _, _ = await self._run(
+                [compiler, *fmt_args, *draft_args, main_file], temp_dir
+            )
+
+            if fmt_args and returncode != 0:
+                # Stale or engine-incompatible format - redo a clean compile
+                fmt_args = []
+                await self._run([compiler, *draft_args, main_file], temp_dir)
+
+            # Check if bibtex is needed - scan the sources first; if nothing
+            # cites anything we can skip reading the .aux back entirely
+            has_citations = any(
+                f["name"].endswith(".tex") and isinstance(f.get("content"), str)
+                and _CITATION_RE.search(f["content"])
+                for f in files
+            )
+            aux_hash = self._hash_file(aux_file)
+            if has_citations and os.path.exists(aux_file):
+                with open(aux_file, "r") as f:
+                    aux_content = f.read()
+                # Skip bibtex when the .aux came out identical to the last
+                # stable compile of this project - citations haven't moved,
+                # so the .bbl on disk is still right
+                if ("\\citation" in aux_content
+                        and aux_hash != self._stable_aux.get(temp_dir)):
+                    await self._run(
+                        ["bibtex", main_file.replace(".tex", "")], temp_dir
+                    )
+                    # Re-run draft passes until the .aux settles (cross-refs
+                    # into the bibliography can shift it twice), capped
+                    for _ in range(2):
+                        await self._run(
+                            [compiler, *fmt_args, *draft_args, main_file], temp_dir
+                        )
+                        new_hash = self._hash_file(aux_file)
+                        if new_hash == aux_hash:
+                            break
+                        aux_hash = new_hash
+            if persistent:
+                self._stable_aux[temp_dir] = aux_hash
+
+            # Final pass: the only one that ships out an actual PDF
+            _, _, stderr = await self._run(
+                [compiler, *fmt_args, "-interaction=nonstopmode", "-halt-on-error", main_file],
+                temp_dir
+            )
+            
+            # Check for PDF output
+            pdf_path = os.path.join(temp_dir, main_file.replace(".tex", ".pdf"))
+            
+            if os.path.exists(pdf_path):
+                if return_path:
+                    # Hand back a throwaway copy outside the build dir so it
+                    # survives cleanup and the caller can delete it freely
+                    fd, out_path = tempfile.mkstemp(suffix=".pdf")
+                    os.close(fd)
+                    if persistent:
+                        await asyncio.to_thread(shutil.copyfile, pdf_path, out_path)
+                    else:
+                        await asyncio.to_thread(shutil.move, pdf_path, out_path)
+                    return True, out_path, None
+                # Multi-MB read off the loop; the compile semaphore above
+                # keeps the thread fan-out bounded
+                pdf_content = await asyncio.to_thread(self._read_bytes, pdf_path)
+                return True, pdf_content, None
+            else:
+                # Extract error from log
+                log_path = os.path.join(temp_dir, main_file.replace(".tex", ".log"))
+                error_msg = self._extract_error(log_path) if os.path.exists(log_path) else stderr
+                return False, None, error_msg or "PDF generation failed"
+
+        except asyncio.TimeoutError:
+            return False, None, f"Compilation timed out after {self.timeout} seconds"
+        except FileNotFoundError as e:
+            return False, None, f"LaTeX compiler not found: {compiler}. Install TeX Live or MiKTeX."
+        except Exception as e:
+            return False, None, str(e)
+        finally:
+            if not persistent:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def _detect_compiler(self, main_content: str) -> str:
+        # Engine-selecting packages live in the preamble, so keying on the
+        # first 2KB lets the edit-compile loop hit the lru_cache instead of
+        # re-scanning an unchanged preamble every compile
+        return _detect_compiler_cached(main_content[:2000], self.compiler)
+    
+    def _extract_error(self, log_path: str) -> str:
+        try:
+            # Errors cluster at the point of failure, near the end of the
+            # log; reading only the last 64KB keeps multi-MB logs from
+            # package-heavy documents out of memory
+            with open(log_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+                f.seek(max(0, end - 65536))
+                content = f.read().decode("utf-8", "ignore")
+
+            # One C-level regex pass instead of per-line startswith checks:
+            # each match is a '!' error plus up to 4 context lines, stopping
+            # at (and including) the 'l.<n>' source-position line
+            errors = [m.group(0) for m in _LATEX_ERROR_RE.finditer(content)]
+            if errors:
+                return "\n\n".join(errors[:3])  # Return first 3 errors
+
+            # Look for warnings if no errors
+            if "Output written on" not in content:
+                return "Compilation failed. Check LaTeX syntax."
+            
+            return None
+        except:
+            return "Could not read compilation log"
+    
+    def get_sample_templates(self) -> Dict[str, str]:
+        return _SAMPLE_TEMPLATES
+
 latex_service = LaTeXService()
@@ -1,49 +1,67 @@
 import os
+from dataclasses import dataclass, field
+from typing import List
 from dotenv import load_dotenv
 
 load_dotenv()
 
-class Config:
+@dataclass(frozen=True, slots=True)
+class _Config:
     # Firebase Configuration
-    FIREBASE_KEY_PATH = os.getenv("FIREBASE_KEY_PATH", "firebase-key.json")
-    
+    FIREBASE_KEY_PATH: str = os.getenv("FIREBASE_KEY_PATH", "firebase-key.json")
+
     # Gemini AI Configuration
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-    GEMINI_FLASH_MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3.0-flash-preview")
-    GEMINI_PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", "gemini-3.1-pro-preview")
-    
+    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    GEMINI_FLASH_MODEL: str = os.getenv("GEMINI_FLASH_MODEL", "gemini-3.0-flash-preview")
+    GEMINI_PRO_MODEL: str = os.getenv("GEMINI_PRO_MODEL", "gemini-3.1-pro-preview")
+
     # Legacy GCP (for Vertex AI if needed)
-    GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "")
-    GCP_BUCKET_NAME = os.getenv("GCP_BUCKET_NAME", "")
-    GCP_REGION = os.getenv("GCP_REGION", "us-central1")
-    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-3.1-pro-preview")
-    
+    GCP_PROJECT_ID: str = os.getenv("GCP_PROJECT_ID", "")
+    GCP_BUCKET_NAME: str = os.getenv("GCP_BUCKET_NAME", "")
+    GCP_REGION: str = os.getenv("GCP_REGION", "us-central1")
+    GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-3.1-pro-preview")
+    GEMINI_CHUNK_CONCURRENCY: int = int(os.getenv("GEMINI_CHUNK_CONCURRENCY", "8"))
+    GEMINI_CONCURRENCY: int = int(os.getenv("GEMINI_CONCURRENCY", "20"))
+    MAX_UPLOADS: int = int(os.getenv("MAX_UPLOADS", "32"))
+
     # LaTeX Configuration
-    LATEX_COMPILER = os.getenv("LATEX_COMPILER", "pdflatex")
-    LATEX_TIMEOUT = int(os.getenv("LATEX_TIMEOUT", "60"))
-    
+    LATEX_COMPILER: str = os.getenv("LATEX_COMPILER", "pdflatex")
+    LATEX_TIMEOUT: int = int(os.getenv("LATEX_TIMEOUT", "60"))
+    # RAM-backed dir for build areas; falls back to the system default
+    # tempdir when the path doesn't exist (macOS, containers without shm)
+    LATEX_TMPFS: str = os.getenv("LATEX_TMPFS", "/dev/shm")
+    # Root for persistent per-project build dirs; empty means derive one
+    # under the tmpfs (or system tempdir) at runtime
+    LATEX_WORK_DIR: str = os.getenv("LATEX_WORK_DIR", "")
+
     # Server Configuration
-    HOST = os.getenv("HOST", "0.0.0.0")
-    PORT = int(os.getenv("PORT", "8000"))
-    DEBUG = os.getenv("DEBUG", "False").lower() == "true"
-    
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = int(os.getenv("PORT", "8000"))
+    DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+
     # Admin Configuration
-    ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "mmorristwo@gmail.com")
-    ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "matt")
-    ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "password")
-    
+    ADMIN_EMAIL: str = os.getenv("ADMIN_EMAIL", "mmorristwo@gmail.com")
+    ADMIN_USERNAME: str = os.getenv("ADMIN_USERNAME", "matt")
+    ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD", "password")
+
     # Security Configuration
-    ALGORITHM = "HS256"
-    JWT_SECRET = os.getenv("JWT_SECRET", "change-me-in-production-use-a-long-random-string")
-    ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
-    ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
-    
+    ALGORITHM: str = "HS256"
+    JWT_SECRET: str = os.getenv("JWT_SECRET", "change-me-in-production-use-a-long-random-string")
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+    ALLOWED_ORIGINS: List[str] = field(default_factory=lambda: os.getenv(
+        "ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:5173"
+    ).split(","))
+
     # File Upload Configuration
-    MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
-    ALLOWED_EXTENSIONS = [".docx", ".doc"]
-    
+    MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
+    ALLOWED_EXTENSIONS: tuple = (".docx", ".doc")
+
     # Database Collections
-    FIRESTORE_COLLECTION_PROJECTS = "projects"
-    FIRESTORE_COLLECTION_USERS = "users"
-    FIRESTORE_COLLECTION_CHATS = "chats"
-    FIRESTORE_COLLECTION_FEEDBACK = "feedback"
+    FIRESTORE_COLLECTION_PROJECTS: str = "projects"
+    FIRESTORE_COLLECTION_USERS: str = "users"
+    FIRESTORE_COLLECTION_CHATS: str = "chats"
+    FIRESTORE_COLLECTION_FEEDBACK: str = "feedback"
+
+# Single shared instance. Importers keep writing `Config.X`, but reads now
+# go through frozen __slots__ storage instead of a class-dict lookup.
+Config = _Config()